@@ -0,0 +1,1054 @@
+import heapq
+import random
+import struct
+import numpy as np
+from point import Point
+from rectangle import Rectangle
+from pointQuadTree import colorList, MAX_DEPTH
+from morton import buildLinear
+
+# child slots, same order PointQuadTree tries them in
+NE, SE, SW, NW = 0, 1, 2, 3
+
+# ArrayQuadTree.searchBox looks at this many nodes one by one before it vectorizes
+SCALAR_WALK = 128
+
+# snapshot file layout: a fixed header, then the arrays below in this order, each one
+# starting on a 64 byte boundary. Bump the version whenever any of it changes.
+SNAPSHOT_MAGIC = b"AQTREE\x00\x00"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<8sIIqqqq4d")
+SNAPSHOT_ALIGN = 64
+SNAPSHOT_NODE_ARRAYS = (
+    ("nodeBounds", "<f8", 4),
+    ("nodeChildren", "<i4", 4),
+    ("nodeDepth", "<i2", 1),
+    ("nodeStart", "<i8", 1),
+    ("nodeCount", "<i8", 1),
+)
+SNAPSHOT_POINT_ARRAYS = (
+    ("xs", "<f8", 1),
+    ("ys", "<f8", 1),
+    ("ids", "<i8", 1),
+)
+
+
+class ArrayQuadTree(object):
+    """
+    class ArrayQuadTree:
+
+        A point quadtree stored as a struct of arrays instead of one object per node.
+
+    Node data lives in flat arrays indexed by node number (bounds, children, depth and
+    the range of the slot pool holding that node's points). Point coordinates live in
+    contiguous `xs` / `ys` arrays and each point is known only by an integer id. Any
+    payload (like `Point.data`) is kept in the `data` side table keyed by that id.
+
+    Only leaves hold points. When a leaf gets more than `maxPoints` points it is split
+    and its points are pushed down, unless it is already at `maxDepth` in which case
+    it simply keeps growing.
+
+    @method: insert          -- insert a Point (or anything with x, y and data)
+    @method: insertXY        -- insert raw coordinates with an optional id / payload
+    @method: insertArrays    -- insert a whole batch of coordinates into a live tree
+    @method: reset           -- clear the tree and load a list of points
+    @method: bulkLoad        -- clear the tree and load coordinate arrays in one pass
+    @method: fromArrays      -- build a new tree straight from coordinate arrays
+    @method: searchBox       -- ids of points inside a Rectangle
+    @method: searchBoxMany   -- ids inside each of many rectangles, in one traversal
+    @method: searchNeighbors -- ids of points sharing the leaf of a point
+    @method: nearest         -- ids and distances of the k closest points
+    @method: getBBoxes       -- node boxes for drawing
+    @method: memoryUsage     -- bytes held by the node and point arrays
+    @method: save            -- write a compact binary snapshot of the tree
+    @method: load            -- open a snapshot, memory mapped (read only) by default
+    @method: snapshotSize    -- bytes a snapshot takes
+    @method: saveBuffer      -- write a snapshot into a memory buffer
+    @method: fromBuffer      -- open a snapshot held in a buffer, without copying
+    """
+
+    def __init__(self, bbox, maxPoints=8, maxDepth=MAX_DEPTH, capacity=1024):
+        self.maxPoints = maxPoints
+        self.maxDepth = maxDepth
+        self.bbox = bbox
+        self.initialCapacity = capacity
+        self.readOnly = False
+
+        self.init()
+
+    def init(self):
+        self._checkWritable()
+        cap = self.initialCapacity
+
+        # node arrays: bounds are left, top, right, bottom and children NE, SE, SW, NW.
+        # A leaf's points are slots[start:start + count], with room for capacity.
+        self.numNodes = 0
+        self.nodeBounds = np.empty((cap, 4), dtype=np.float64)
+        self.nodeChildren = np.full((cap, 4), -1, dtype=np.int32)
+        self.nodeDepth = np.zeros(cap, dtype=np.int16)
+        self.nodeStart = np.zeros(cap, dtype=np.int64)
+        self.nodeCount = np.zeros(cap, dtype=np.int64)
+        self.nodeCapacity = np.zeros(cap, dtype=np.int64)
+
+        # point arrays
+        self.numPoints = 0
+        self.xs = np.empty(cap, dtype=np.float64)
+        self.ys = np.empty(cap, dtype=np.float64)
+        self.ids = np.empty(cap, dtype=np.int64)
+        self.data = {}
+
+        # pool of point indexes, every bucket owns a contiguous range of it. None when
+        # the points themselves are stored bucket by bucket (a loaded snapshot).
+        self.numSlots = 0
+        self.slots = np.empty(cap, dtype=np.int64)
+
+        self._newNode(
+            self.bbox.left, self.bbox.top, self.bbox.right, self.bbox.bottom, 0
+        )
+
+    def __len__(self):
+        return self.numPoints
+
+    def __str__(self):
+        return "%s(points: %s, nodes: %s, maxPoints: %s, bbox: %s)" % (
+            self.__class__.__name__,
+            self.numPoints,
+            self.numNodes,
+            self.maxPoints,
+            self.bbox,
+        )
+
+    def reset(self, points):
+        """
+        Clear the tree and load a list of points with one bulk load (see bulkLoad).
+        Points outside the bbox are skipped, the others get the ids 0, 1, .. in order
+        and their payload goes in the `data` side table, just as if they were
+        inserted one at a time.
+        Params:
+            points (list) : anything with x, y and (optionally) data
+        Returns:
+            None
+        """
+        b = self.bbox
+        points = [
+            p for p in points if b.left <= p.x <= b.right and b.top <= p.y <= b.bottom
+        ]
+        xs = np.fromiter((p.x for p in points), np.float64, len(points))
+        ys = np.fromiter((p.y for p in points), np.float64, len(points))
+        self.bulkLoad(xs, ys)
+        for id, point in enumerate(points):
+            data = getattr(point, "data", None)
+            if data:
+                self.data[id] = data
+
+    @classmethod
+    def fromArrays(cls, bbox, xs, ys, ids=None, maxPoints=8, maxDepth=MAX_DEPTH):
+        """Build a tree from coordinate arrays with a Morton order bulk load.
+        Params:
+            bbox (Rectangle) : bounds of the tree
+            xs (array) : x coordinates
+            ys (array) : y coordinates
+            ids (array) : integer id per point, defaults to the array index
+            maxPoints (int) : leaf capacity
+            maxDepth (int) : leaves at this depth are never split
+        Returns:
+            ArrayQuadTree
+        """
+        tree = cls(bbox, maxPoints, maxDepth)
+        tree.bulkLoad(xs, ys, ids)
+        return tree
+
+    def bulkLoad(self, xs, ys, ids=None):
+        """
+        Clear the tree and load whole coordinate arrays at once. Points are sorted by
+        Morton key and the nodes are cut out of the sorted order level by level instead
+        of inserting one point at a time. Points outside the bbox are skipped.
+        Params:
+            xs (array) : x coordinates
+            ys (array) : y coordinates
+            ids (array) : integer id per point, defaults to the array index
+        Returns:
+            int : number of points loaded
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if ids is None:
+            ids = np.arange(len(xs), dtype=np.int64)
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+
+        inside = (
+            (xs >= self.bbox.left)
+            & (xs <= self.bbox.right)
+            & (ys >= self.bbox.top)
+            & (ys <= self.bbox.bottom)
+        )
+        if not inside.all():
+            xs, ys, ids = xs[inside], ys[inside], ids[inside]
+
+        self.init()
+        n = len(xs)
+        self._ensurePoints(n)
+        self.xs[:n] = xs
+        self.ys[:n] = ys
+        self.ids[:n] = ids
+        self.numPoints = n
+
+        self._graft(0, np.arange(n, dtype=np.int64))
+        return n
+
+    def insert(self, point, id=None):
+        """
+        Insert a new point into the tree.
+        Params:
+            point (Point) : anything with x, y and (optionally) data
+            id (int) : id to store the point under, defaults to its insertion index
+        Returns:
+            bool : False if the point is outside of the tree's bbox
+        """
+        return self.insertXY(point.x, point.y, id, getattr(point, "data", None))
+
+    def insertXY(self, x, y, id=None, data=None):
+        """
+        Insert raw coordinates into the tree.
+        Params:
+            x (float)
+            y (float)
+            id (int) : id to store the point under, defaults to its insertion index
+            data : payload kept in the `data` side table
+        Returns:
+            bool : False if the point is outside of the tree's bbox
+        """
+        self._checkWritable()
+        if not self.bbox.left <= x <= self.bbox.right:
+            return False
+        if not self.bbox.top <= y <= self.bbox.bottom:
+            return False
+
+        index = self.numPoints
+        if id is None:
+            id = index
+
+        self._ensurePoints(index + 1)
+        self.xs[index] = x
+        self.ys[index] = y
+        self.ids[index] = id
+        self.numPoints += 1
+        if data:
+            self.data[id] = data
+
+        node = self._findLeaf(x, y)
+        self._appendToBucket(node, index)
+        if self.nodeCount[node] > self.maxPoints:
+            self._split(node)
+        return True
+
+    def insertArrays(self, xs, ys, ids=None):
+        """
+        Insert a batch of coordinates into the tree as it is, without rebuilding it. All
+        points are routed to their leaves together, every touched leaf gets one new slot
+        range holding its old and new points, and all leaves that overflow are split
+        together, round by round. Points outside the bbox are skipped.
+        Params:
+            xs (array) : x coordinates
+            ys (array) : y coordinates
+            ids (array) : integer id per point, defaults to the insertion index
+        Returns:
+            int : number of points inserted
+        """
+        self._checkWritable()
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if ids is None:
+            ids = np.arange(self.numPoints, self.numPoints + len(xs), dtype=np.int64)
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+
+        inside = (
+            (xs >= self.bbox.left)
+            & (xs <= self.bbox.right)
+            & (ys >= self.bbox.top)
+            & (ys <= self.bbox.bottom)
+        )
+        if not inside.all():
+            xs, ys, ids = xs[inside], ys[inside], ids[inside]
+        n = len(xs)
+        if not n:
+            return 0
+
+        first = self.numPoints
+        self._ensurePoints(first + n)
+        self.xs[first : first + n] = xs
+        self.ys[first : first + n] = ys
+        self.ids[first : first + n] = ids
+        self.numPoints += n
+        new = np.arange(first, first + n, dtype=np.int64)
+
+        # group the new points by leaf
+        leaves = self._findLeaves(xs, ys)
+        order = np.argsort(leaves, kind="stable")
+        new = new[order]
+        touched, added = np.unique(leaves[order], return_counts=True)
+
+        # every touched leaf moves to a fresh slot range: old points, then new ones
+        old = self.nodeCount[touched]
+        capacity = np.maximum(old + added, self.maxPoints + 1)
+        starts = self.numSlots + np.concatenate(([0], np.cumsum(capacity)[:-1]))
+        self._ensureSlots(self.numSlots + int(capacity.sum()))
+        self.slots[_runIndexes(starts, old)] = self._bucketPoints(touched)
+        self.slots[_runIndexes(starts + old, added)] = new
+        self.numSlots += int(capacity.sum())
+        self.nodeStart[touched] = starts
+        self.nodeCount[touched] = old + added
+        self.nodeCapacity[touched] = capacity
+
+        self._splitMany(touched[old + added > self.maxPoints])
+        if self.numSlots > 2 * int(self.nodeCapacity[: self.numNodes].sum()):
+            self._compactSlots()
+        return n
+
+    def searchBox(self, bbox):
+        """Return the ids of all points that fall within the specified bounding box.
+
+        The walk starts node by node from an explicit stack, which is cheapest when
+        only a few nodes touch the query (small boxes). After SCALAR_WALK nodes the
+        nodes still waiting are handed to a vectorized walk, one level at a time.
+        Params:
+            bbox (Rectangle)
+        Returns:
+            ndarray : ids of the matching points
+        """
+        ql, qt, qr, qb = bbox.left, bbox.top, bbox.right, bbox.bottom
+        inside = []
+        straddling = []
+
+        # entries are (node, its bounds), only nodes that touch the query go in. A
+        # node's quadrants are cut at its midpoints, so their bounds need no lookup.
+        stack = []
+        l, t, r, b = self.nodeBounds[0].tolist()
+        if l <= qr and r >= ql and t <= qb and b >= qt:
+            stack.append((0, l, t, r, b))
+        budget = SCALAR_WALK
+        while stack and budget:
+            budget -= 1
+            node, l, t, r, b = stack.pop()
+            ne, se, sw, nw = self.nodeChildren[node].tolist()
+            if ne >= 0:
+                mX = (l + r) / 2
+                mY = (t + b) / 2
+                east = mX <= qr
+                west = mX >= ql
+                if mY >= qt:
+                    if west:
+                        stack.append((nw, l, t, mX, mY))
+                    if east:
+                        stack.append((ne, mX, t, r, mY))
+                if mY <= qb:
+                    if west:
+                        stack.append((sw, l, mY, mX, b))
+                    if east:
+                        stack.append((se, mX, mY, r, b))
+            elif ql <= l and r <= qr and qt <= t and b <= qb:
+                inside.append(node)
+            else:
+                straddling.append(node)
+        inside = [np.array(inside, dtype=np.int64)]
+        straddling = [np.array(straddling, dtype=np.int64)]
+
+        # walk the rest of the tree one level at a time, keeping only nodes that touch
+        # the query
+        nodes = np.array([entry[0] for entry in stack], dtype=np.int64)
+        while nodes.size:
+            b = self.nodeBounds[nodes]
+            hit = (b[:, 0] <= qr) & (b[:, 2] >= ql) & (b[:, 1] <= qb) & (b[:, 3] >= qt)
+            nodes = nodes[hit]
+            b = b[hit]
+
+            kids = self.nodeChildren[nodes]
+            isLeaf = kids[:, 0] < 0
+            covered = (
+                (b[:, 0] >= ql) & (b[:, 2] <= qr) & (b[:, 1] >= qt) & (b[:, 3] <= qb)
+            )
+
+            inside.append(nodes[isLeaf & covered])
+            straddling.append(nodes[isLeaf & ~covered])
+
+            kids = kids[~isLeaf].ravel()
+            nodes = kids[kids >= 0].astype(np.int64)
+
+        # leaves entirely inside the query don't need their points tested
+        accepted = self._bucketPoints(np.concatenate(inside))
+        candidates = self._bucketPoints(np.concatenate(straddling))
+        x = self.xs[candidates]
+        y = self.ys[candidates]
+        keep = (x >= ql) & (x <= qr) & (y >= qt) & (y <= qb)
+
+        return self.ids[np.concatenate((accepted, candidates[keep]))]
+
+    def searchBoxMany(self, rects):
+        """Run a whole batch of box queries in a single traversal of the tree.
+
+        The walk goes level by level over (node, query) pairs: a pair survives only if
+        the query touches the node, internal nodes hand their surviving queries on to
+        their children, and at the leaves a query that covers the leaf takes all its
+        points while the others test them.
+        Params:
+            rects (array) : (m, 4) left, top, right, bottom per query, or Rectangles
+        Returns:
+            tuple : (offsets, indices) in CSR layout, the ids matching query i are
+                    indices[offsets[i]:offsets[i + 1]]
+        """
+        if len(rects) and hasattr(rects[0], "left"):
+            rects = [(r.left, r.top, r.right, r.bottom) for r in rects]
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        m = len(rects)
+        # normalize so left <= right and top <= bottom
+        ql = np.minimum(rects[:, 0], rects[:, 2])
+        qr = np.maximum(rects[:, 0], rects[:, 2])
+        qt = np.minimum(rects[:, 1], rects[:, 3])
+        qb = np.maximum(rects[:, 1], rects[:, 3])
+
+        nodes = np.zeros(m, dtype=np.int64)
+        queries = np.arange(m, dtype=np.int64)
+        foundQueries = [np.empty(0, dtype=np.int64)]
+        foundPoints = [np.empty(0, dtype=np.int64)]
+
+        while nodes.size:
+            b = self.nodeBounds[nodes]
+            l, t, r, bt = ql[queries], qt[queries], qr[queries], qb[queries]
+            hit = (b[:, 0] <= r) & (b[:, 2] >= l) & (b[:, 1] <= bt) & (b[:, 3] >= t)
+            nodes, queries, b = nodes[hit], queries[hit], b[hit]
+            l, t, r, bt = l[hit], t[hit], r[hit], bt[hit]
+
+            kids = self.nodeChildren[nodes]
+            isLeaf = kids[:, 0] < 0
+            covered = (b[:, 0] >= l) & (b[:, 2] <= r) & (b[:, 1] >= t) & (b[:, 3] <= bt)
+
+            # leaves the query covers: take every point
+            take = isLeaf & covered
+            counts = self.nodeCount[nodes[take]]
+            foundPoints.append(self._bucketPoints(nodes[take]))
+            foundQueries.append(np.repeat(queries[take], counts))
+
+            # leaves the query straddles: test every point
+            test = isLeaf & ~covered
+            counts = self.nodeCount[nodes[test]]
+            points = self._bucketPoints(nodes[test])
+            owner = np.repeat(queries[test], counts)
+            x = self.xs[points]
+            y = self.ys[points]
+            keep = (
+                (x >= ql[owner])
+                & (x <= qr[owner])
+                & (y >= qt[owner])
+                & (y <= qb[owner])
+            )
+            foundPoints.append(points[keep])
+            foundQueries.append(owner[keep])
+
+            # internal nodes pass their queries on to all four children
+            inner = ~isLeaf
+            nodes = kids[inner].ravel().astype(np.int64)
+            queries = np.repeat(queries[inner], 4)
+
+        owner = np.concatenate(foundQueries)
+        points = np.concatenate(foundPoints)
+        order = np.argsort(owner, kind="stable")
+        offsets = np.zeros(m + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owner, minlength=m), out=offsets[1:])
+        return offsets, self.ids[points[order]]
+
+    def searchNeighbors(self, point):
+        """Returns the ids of the points that are in the same container as another point."""
+        # If its not a point (its a bounding rectangle)
+        if not hasattr(point, "x"):
+            return np.empty(0, dtype=np.int64)
+
+        if not self.bbox.contains(point):
+            return np.empty(0, dtype=np.int64)
+
+        node = self._findLeaf(point.x, point.y)
+        return self.ids[self._bucketPoints(np.array([node]))]
+
+    def nearest(self, point, k=1, maxDistance=None):
+        """Find the k points closest to a point.
+
+        Nodes are opened best first from a priority queue keyed by the distance to their
+        bounds, and the search stops as soon as the next node is further away than the
+        k-th best point found so far. A leaf's points are measured all at once.
+        Params:
+            point (Point) : anything with x and y
+            k (int) : number of points wanted
+            maxDistance (float) : ignore points further away than this
+        Returns:
+            tuple : (ids, distances) arrays of up to k points, closest first
+        """
+        x = point.x
+        y = point.y
+        limit = np.inf if maxDistance is None else maxDistance * maxDistance
+        bestIds = np.empty(0, dtype=np.int64)
+        bestDist = np.empty(0, dtype=np.float64)
+        if k <= 0:
+            return bestIds, bestDist
+
+        queue = [(_boundsDistanceSq(self.nodeBounds[0], x, y), 0)]
+        while queue:
+            d, node = heapq.heappop(queue)
+            if d > limit or (len(bestDist) == k and d > bestDist[-1]):
+                break
+            kids = self.nodeChildren[node]
+            if kids[0] >= 0:
+                for child in kids.tolist():
+                    heapq.heappush(
+                        queue, (_boundsDistanceSq(self.nodeBounds[child], x, y), child)
+                    )
+                continue
+
+            points = self._bucketPoints(np.array([node]))
+            if not points.size:
+                continue
+            dx = self.xs[points] - x
+            dy = self.ys[points] - y
+            distSq = dx * dx + dy * dy
+            keep = distSq <= limit
+            ids = np.concatenate((bestIds, self.ids[points[keep]]))
+            dist = np.concatenate((bestDist, distSq[keep]))
+            order = np.argsort(dist, kind="stable")[:k]
+            bestIds = ids[order]
+            bestDist = dist[order]
+
+        return bestIds, np.sqrt(bestDist)
+
+    def getBBoxes(self):
+        """Print helper to draw tree"""
+        bboxes = []
+        for node in range(self.numNodes):
+            l, t, r, b = self.nodeBounds[node]
+            depth = int(self.nodeDepth[node])
+            bboxes.append(
+                {
+                    "bbox": Rectangle(p1=Point(l, t), p2=Point(r, b)),
+                    "color": colorList[depth % len(colorList)],
+                    "parent": depth,
+                }
+            )
+        return bboxes
+
+    def memoryUsage(self):
+        """Bytes used by the live part of the node and point arrays (side table excluded).
+        Params:
+            None
+        Returns:
+            int : bytes
+        """
+        perNode = (
+            self.nodeBounds.itemsize * 4
+            + self.nodeChildren.itemsize * 4
+            + self.nodeDepth.itemsize
+            + self.nodeStart.itemsize
+            + self.nodeCount.itemsize
+            + self.nodeCapacity.itemsize
+        )
+        perPoint = self.xs.itemsize + self.ys.itemsize + self.ids.itemsize
+        slots = 0 if self.slots is None else self.slots.itemsize * self.numSlots
+        return perNode * self.numNodes + perPoint * self.numPoints + slots
+
+    def save(self, path):
+        """Write the tree to a binary snapshot file.
+
+        The file is a fixed header (magic, version, sizes, maxPoints, maxDepth, bbox)
+        followed by fixed width little endian arrays: node bounds, children, depth and
+        point ranges, then the point coordinates and ids. Points are written bucket by
+        bucket so every leaf's points are one contiguous range and no slot pool is
+        needed. The `data` side table isn't saved.
+        Params:
+            path (str) : file to write
+        Returns:
+            int : bytes written
+        """
+        header, arrays, layout, size = self._snapshot()
+        with open(path, "wb") as f:
+            f.write(header)
+            for name, dtype, shape, offset in layout:
+                f.write(b"\x00" * (offset - f.tell()))
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+            f.write(b"\x00" * (size - f.tell()))
+        return size
+
+    def snapshotSize(self):
+        """Bytes a snapshot of the tree takes (see save)."""
+        return _snapshotLayout(self.numNodes, self.numPoints)[1]
+
+    def saveBuffer(self, buffer):
+        """Write the same snapshot `save` writes into a writable buffer (a bytearray,
+        mmap, shared memory block..) of at least snapshotSize() bytes.
+        Params:
+            buffer (buffer) : where to write the snapshot, from its first byte on
+        Returns:
+            int : bytes written
+        """
+        header, arrays, layout, size = self._snapshot()
+        out = np.frombuffer(buffer, dtype=np.uint8)
+        if len(out) < size:
+            raise ValueError("The snapshot needs %d bytes, got %d" % (size, len(out)))
+        out[:size] = 0
+        out[: len(header)] = np.frombuffer(header, dtype=np.uint8)
+        for name, dtype, shape, offset in layout:
+            out[offset : offset + _nbytes(dtype, shape)].view(dtype).reshape(shape)[
+                ...
+            ] = arrays[name]
+        return size
+
+    def _snapshot(self):
+        """Header bytes, compacted arrays by name, layout and size of a snapshot."""
+        n = self.numNodes
+        counts = self.nodeCount[:n].astype(np.int64)
+        starts = np.zeros(n, dtype=np.int64)
+        np.cumsum(counts[:-1], out=starts[1:])
+        points = self._bucketPoints(np.arange(n))
+
+        arrays = {
+            "nodeBounds": self.nodeBounds[:n],
+            "nodeChildren": self.nodeChildren[:n],
+            "nodeDepth": self.nodeDepth[:n],
+            "nodeStart": np.where(counts > 0, starts, 0),
+            "nodeCount": counts,
+            "xs": self.xs[points],
+            "ys": self.ys[points],
+            "ids": self.ids[points],
+        }
+        layout, size = _snapshotLayout(n, len(points))
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            SNAPSHOT_HEADER.size,
+            n,
+            len(points),
+            self.maxPoints,
+            self.maxDepth,
+            self.bbox.left,
+            self.bbox.top,
+            self.bbox.right,
+            self.bbox.bottom,
+        )
+        return header, arrays, layout, size
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a snapshot written by `save`.
+
+        With mmap the arrays are read only views straight onto the memory mapped file:
+        nothing is copied or parsed, pages are only read when a query touches them, and
+        the tree can't be changed. Without mmap the file is read into ordinary arrays
+        and the tree can be inserted into again.
+        Params:
+            path (str) : snapshot file
+            mmap (bool) : map the file instead of reading it
+        Returns:
+            ArrayQuadTree
+        """
+        if mmap:
+            buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            buffer = np.fromfile(path, dtype=np.uint8)
+        tree = cls.fromBuffer(buffer, path)
+        if not mmap:
+            # own, native copies with an identity slot pool, ready to grow again
+            layout, size = _snapshotLayout(tree.numNodes, tree.numPoints)
+            for name, dtype, shape, offset in layout:
+                setattr(tree, name, getattr(tree, name).astype(dtype[1:]))
+            tree.readOnly = False
+            tree.nodeCapacity = tree.nodeCount.copy()
+            tree.slots = np.arange(tree.numPoints, dtype=np.int64)
+            tree.numSlots = tree.numPoints
+        return tree
+
+    @classmethod
+    def fromBuffer(cls, buffer, source="buffer"):
+        """Open a snapshot held in memory (see saveBuffer) without copying it: the
+        tree's arrays are read only views onto the buffer, which has to outlive it.
+        Params:
+            buffer (buffer) : snapshot bytes, from the first byte on
+            source (str) : what to call the buffer in error messages
+        Returns:
+            ArrayQuadTree
+        """
+        buffer = np.frombuffer(buffer, dtype=np.uint8)
+        raw = buffer[: SNAPSHOT_HEADER.size].tobytes()
+        if len(raw) < SNAPSHOT_HEADER.size or raw[:8] != SNAPSHOT_MAGIC:
+            raise ValueError("%s is not an ArrayQuadTree snapshot" % source)
+        (
+            _,
+            version,
+            headerSize,
+            numNodes,
+            numPoints,
+            maxPoints,
+            maxDepth,
+            l,
+            t,
+            r,
+            b,
+        ) = SNAPSHOT_HEADER.unpack(raw)
+        if version != SNAPSHOT_VERSION or headerSize != SNAPSHOT_HEADER.size:
+            raise ValueError(
+                "%s has snapshot version %s, expected %s"
+                % (source, version, SNAPSHOT_VERSION)
+            )
+
+        layout, size = _snapshotLayout(numNodes, numPoints)
+        if len(buffer) < size:
+            raise ValueError("%s is truncated" % source)
+
+        tree = cls.__new__(cls)
+        tree.maxPoints = maxPoints
+        tree.maxDepth = maxDepth
+        tree.bbox = Rectangle(p1=Point(l, t), p2=Point(r, b))
+        tree.initialCapacity = max(numNodes, numPoints, 1)
+        tree.numNodes = numNodes
+        tree.numPoints = numPoints
+        tree.data = {}
+        for name, dtype, shape, offset in layout:
+            array = buffer[offset : offset + _nbytes(dtype, shape)].view(dtype)
+            array.flags.writeable = False
+            setattr(tree, name, array.reshape(shape))
+        tree.readOnly = True
+        tree.nodeCapacity = tree.nodeCount
+        tree.slots = None
+        tree.numSlots = 0
+        return tree
+
+    def _checkWritable(self):
+        if getattr(self, "readOnly", False):
+            raise ValueError("This tree is a read only (memory mapped) snapshot")
+
+    def _findLeaf(self, x, y):
+        """Walk down from the root to the leaf whose quadrant holds (x, y)."""
+        node = 0
+        children = self.nodeChildren
+        bounds = self.nodeBounds
+        while children[node, 0] >= 0:
+            l, t, r, b = bounds[node]
+            east = x >= (l + r) / 2
+            south = y >= (t + b) / 2
+            if east:
+                node = children[node, SE if south else NE]
+            else:
+                node = children[node, SW if south else NW]
+        return node
+
+    def _findLeaves(self, xs, ys):
+        """_findLeaf for whole coordinate arrays, all walking down together."""
+        nodes = np.zeros(len(xs), dtype=np.int64)
+        active = np.arange(len(xs))
+        while active.size:
+            kids = self.nodeChildren[nodes[active]]
+            inner = kids[:, 0] >= 0
+            active = active[inner]
+            kids = kids[inner]
+            b = self.nodeBounds[nodes[active]]
+            east = xs[active] >= (b[:, 0] + b[:, 2]) / 2
+            south = ys[active] >= (b[:, 1] + b[:, 3]) / 2
+            quadrant = np.where(east, np.where(south, SE, NE), np.where(south, SW, NW))
+            nodes[active] = kids[np.arange(len(active)), quadrant]
+        return nodes
+
+    def _bucketPoints(self, nodes):
+        """Point indexes held by the buckets of `nodes`, in one array."""
+        starts = self.nodeStart[nodes]
+        counts = self.nodeCount[nodes]
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # offset of every slot: start of its bucket + its position in the bucket
+        ends = np.cumsum(counts)
+        offsets = np.repeat(starts - ends + counts, counts) + np.arange(total)
+        if self.slots is None:
+            return offsets
+        return self.slots[offsets]
+
+    def _newNode(self, l, t, r, b, depth):
+        node = self.numNodes
+        self._ensureNodes(node + 1)
+        self.nodeBounds[node] = (l, t, r, b)
+        self.nodeChildren[node] = -1
+        self.nodeDepth[node] = depth
+        self.nodeStart[node] = 0
+        self.nodeCount[node] = 0
+        self.nodeCapacity[node] = 0
+        self.numNodes += 1
+        return node
+
+    def _reserve(self, node, capacity):
+        """Give `node` a fresh slot range at the end of the pool, keeping its points."""
+        start = self.numSlots
+        self._ensureSlots(start + capacity)
+        count = self.nodeCount[node]
+        old = self.nodeStart[node]
+        self.slots[start : start + count] = self.slots[old : old + count]
+        self.nodeStart[node] = start
+        self.nodeCapacity[node] = capacity
+        self.numSlots += capacity
+
+    def _appendToBucket(self, node, index):
+        count = self.nodeCount[node]
+        if count == self.nodeCapacity[node]:
+            self._reserve(node, max(self.maxPoints + 1, 2 * count))
+        self.slots[self.nodeStart[node] + count] = index
+        self.nodeCount[node] = count + 1
+
+    def _split(self, node):
+        """
+        Split an overflowing leaf into NE/SE/SW/NW quadrants and push its points down.
+        Keeps splitting while a child still overflows, up to maxDepth. A leaf whose
+        points all share one position stays an (overfull) bucket.
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            depth = self.nodeDepth[node]
+            if depth >= self.maxDepth or self.nodeCount[node] <= self.maxPoints:
+                continue
+
+            points = self._bucketPoints(np.array([node]))
+            if np.ptp(self.xs[points]) == 0 and np.ptp(self.ys[points]) == 0:
+                # all on the same spot, splitting would never separate them
+                continue
+
+            l, t, r, b = self.nodeBounds[node]
+            mX = (l + r) / 2
+            mY = (t + b) / 2
+            east = self.xs[points] >= mX
+            south = self.ys[points] >= mY
+            quadrant = np.where(east, np.where(south, SE, NE), np.where(south, SW, NW))
+
+            quads = (
+                (mX, t, r, mY),  # NE
+                (mX, mY, r, b),  # SE
+                (l, mY, mX, b),  # SW
+                (l, t, mX, mY),  # NW
+            )
+            for q, (cl, ct, cr, cb) in enumerate(quads):
+                child = self._newNode(cl, ct, cr, cb, depth + 1)
+                self.nodeChildren[node, q] = child
+                members = points[quadrant == q]
+                self.nodeCount[child] = 0
+                self._reserve(child, max(self.maxPoints + 1, len(members)))
+                self.slots[
+                    self.nodeStart[child] : self.nodeStart[child] + len(members)
+                ] = members
+                self.nodeCount[child] = len(members)
+                if len(members) > self.maxPoints:
+                    stack.append(child)
+
+            # internal nodes don't own any slots
+            self.nodeStart[node] = 0
+            self.nodeCount[node] = 0
+            self.nodeCapacity[node] = 0
+
+    def _splitMany(self, leaves):
+        """
+        _split for many leaves at once: every round splits all overflowing leaves
+        together, sorting their points into the new quadrants with array operations,
+        and hands the children that still overflow to the next round.
+        """
+        leaves = np.asarray(leaves, dtype=np.int64)
+        while leaves.size:
+            counts = self.nodeCount[leaves]
+            leaves = leaves[(self.nodeDepth[leaves] < self.maxDepth) & (counts > 0)]
+            counts = self.nodeCount[leaves]
+            if not leaves.size:
+                return
+
+            points = self._bucketPoints(leaves)
+            owner = np.repeat(np.arange(len(leaves)), counts)
+            x = self.xs[points]
+            y = self.ys[points]
+
+            # leaves whose points all share one position stay buckets
+            cuts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            spread = (np.maximum.reduceat(x, cuts) > np.minimum.reduceat(x, cuts)) | (
+                np.maximum.reduceat(y, cuts) > np.minimum.reduceat(y, cuts)
+            )
+            if not spread.all():
+                keep = spread[owner]
+                leaves, counts = leaves[spread], counts[spread]
+                points, x, y = points[keep], x[keep], y[keep]
+                owner = np.repeat(np.arange(len(leaves)), counts)
+                if not leaves.size:
+                    return
+
+            k = len(leaves)
+            l, t, r, b = self.nodeBounds[leaves].T
+            mX = (l + r) / 2
+            mY = (t + b) / 2
+            east = x >= mX[owner]
+            south = y >= mY[owner]
+            quadrant = np.where(east, np.where(south, SE, NE), np.where(south, SW, NW))
+
+            # 4 children per leaf, numbered leaf by leaf in NE, SE, SW, NW order
+            first = self.numNodes
+            self._ensureNodes(first + 4 * k)
+            kids = first + np.arange(4 * k).reshape(k, 4)
+            bounds = np.empty((k, 4, 4), dtype=np.float64)
+            bounds[:, NE] = np.stack((mX, t, r, mY), axis=1)
+            bounds[:, SE] = np.stack((mX, mY, r, b), axis=1)
+            bounds[:, SW] = np.stack((l, mY, mX, b), axis=1)
+            bounds[:, NW] = np.stack((l, t, mX, mY), axis=1)
+            self.nodeBounds[first : first + 4 * k] = bounds.reshape(4 * k, 4)
+            self.nodeChildren[first : first + 4 * k] = -1
+            self.nodeDepth[first : first + 4 * k] = np.repeat(
+                self.nodeDepth[leaves] + 1, 4
+            )
+            self.nodeChildren[leaves] = kids
+            self.numNodes += 4 * k
+
+            # children get consecutive slot ranges, with room to grow to maxPoints + 1
+            child = kids.ravel()[owner * 4 + quadrant]
+            order = np.argsort(child, kind="stable")
+            childCounts = np.bincount(child - first, minlength=4 * k)
+            capacity = np.maximum(childCounts, self.maxPoints + 1)
+            base = self.numSlots
+            self._ensureSlots(base + int(capacity.sum()))
+            childStarts = base + np.concatenate(([0], np.cumsum(capacity)[:-1]))
+            self.slots[_runIndexes(childStarts, childCounts)] = points[order]
+            self.numSlots += int(capacity.sum())
+            self.nodeStart[first : first + 4 * k] = childStarts
+            self.nodeCount[first : first + 4 * k] = childCounts
+            self.nodeCapacity[first : first + 4 * k] = capacity
+
+            # internal nodes don't own any slots
+            self.nodeStart[leaves] = 0
+            self.nodeCount[leaves] = 0
+            self.nodeCapacity[leaves] = 0
+
+            leaves = first + np.flatnonzero(childCounts > self.maxPoints)
+
+    def _compactSlots(self):
+        """Pack every bucket into a new pool, dropping the ranges left behind by moves."""
+        nodes = np.flatnonzero(self.nodeCapacity[: self.numNodes])
+        capacity = self.nodeCapacity[nodes]
+        starts = np.concatenate(([0], np.cumsum(capacity)[:-1]))
+        slots = np.empty(max(int(capacity.sum()), 1), dtype=np.int64)
+        slots[_runIndexes(starts, self.nodeCount[nodes])] = self._bucketPoints(nodes)
+        self.slots = slots
+        self.numSlots = int(capacity.sum())
+        self.nodeStart[nodes] = starts
+
+    def _graft(self, node, points, built=None):
+        """
+        Bulk build a subtree for the point indexes `points` under the empty leaf `node`
+        and splice its arrays onto the end of this tree's arrays. `built` is the
+        buildLinear result for those points if it was already worked out elsewhere.
+        """
+        depth = int(self.nodeDepth[node])
+        if built is None:
+            built = buildLinear(
+                self.xs[points],
+                self.ys[points],
+                tuple(self.nodeBounds[node]),
+                self.maxPoints,
+                self.maxDepth - depth,
+            )
+        order, bounds, children, depths, starts, counts = built
+
+        # the subtree root becomes `node`, everything else is appended
+        k = len(depths)
+        renumber = np.empty(k, dtype=np.int64)
+        renumber[0] = node
+        renumber[1:] = self.numNodes + np.arange(k - 1)
+        self._ensureNodes(self.numNodes + k - 1)
+
+        base = self.numSlots
+        self._ensureSlots(base + len(points))
+        self.slots[base : base + len(points)] = points[order]
+        self.numSlots += len(points)
+
+        self.nodeBounds[renumber] = bounds
+        self.nodeChildren[renumber] = np.where(children >= 0, renumber[children], -1)
+        self.nodeDepth[renumber] = depths + depth
+        self.nodeStart[renumber] = np.where(counts > 0, starts + base, 0)
+        self.nodeCount[renumber] = counts
+        self.nodeCapacity[renumber] = counts
+        self.numNodes += k - 1
+
+    def _ensureNodes(self, n):
+        if n <= len(self.nodeDepth):
+            return
+        cap = max(n, 2 * len(self.nodeDepth))
+        self.nodeBounds = _grow(self.nodeBounds, cap)
+        self.nodeChildren = _grow(self.nodeChildren, cap, -1)
+        self.nodeDepth = _grow(self.nodeDepth, cap)
+        self.nodeStart = _grow(self.nodeStart, cap)
+        self.nodeCount = _grow(self.nodeCount, cap)
+        self.nodeCapacity = _grow(self.nodeCapacity, cap)
+
+    def _ensurePoints(self, n):
+        if n <= len(self.xs):
+            return
+        cap = max(n, 2 * len(self.xs))
+        self.xs = _grow(self.xs, cap)
+        self.ys = _grow(self.ys, cap)
+        self.ids = _grow(self.ids, cap)
+
+    def _ensureSlots(self, n):
+        if n <= len(self.slots):
+            return
+        self.slots = _grow(self.slots, max(n, 2 * len(self.slots)))
+
+
+def _runIndexes(starts, counts):
+    """Concatenation of the ranges start:start + count, in one array."""
+    total = int(counts.sum())
+    ends = np.cumsum(counts)
+    return np.repeat(starts - ends + counts, counts) + np.arange(total)
+
+
+def _boundsDistanceSq(bounds, x, y):
+    """Squared distance from (x, y) to a node's (left, top, right, bottom) bounds."""
+    l, t, r, b = bounds.tolist()
+    dx = max(l - x, 0, x - r)
+    dy = max(t - y, 0, y - b)
+    return dx * dx + dy * dy
+
+
+def _nbytes(dtype, shape):
+    return int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+
+def _snapshotLayout(numNodes, numPoints):
+    """
+    Where every array of a snapshot starts. Returns ([(name, dtype, shape, offset)],
+    total size in bytes).
+    """
+    layout = []
+    offset = SNAPSHOT_HEADER.size
+    for arrays, n in (
+        (SNAPSHOT_NODE_ARRAYS, numNodes),
+        (SNAPSHOT_POINT_ARRAYS, numPoints),
+    ):
+        for name, dtype, width in arrays:
+            shape = (n, width) if width > 1 else (n,)
+            offset = -(-offset // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+            layout.append((name, dtype, shape, offset))
+            offset += _nbytes(dtype, shape)
+    return layout, offset
+
+
+def _grow(array, n, fill=0):
+    """Return a copy of `array` with room for `n` rows."""
+    grown = np.full((n,) + array.shape[1:], fill, dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+if __name__ == "__main__":
+    bbox = Rectangle(p1=Point(0, 0), p2=Point(1000, 1000))
+    tree = ArrayQuadTree(bbox, 8)
+    for i in range(10000):
+        tree.insert(
+            Point(random.random() * 1000, random.random() * 1000, data={"id": i})
+        )
+    print(tree)
+    print(tree.memoryUsage() / len(tree), "bytes per point")
+    print(len(tree.searchBox(Rectangle(p1=Point(100, 100), p2=Point(200, 200)))))
@@ -0,0 +1,309 @@
+import math
+import random
+import numpy as np
+from point import Point
+from rectangle import Bounds
+
+
+class BallSystem(object):
+    """
+    class BallSystem:
+
+        Holds many balls as parallel arrays and moves all of them in one step.
+
+    Positions, steps (the `vector.dx` / `vector.dy` of a Ball), radii and bearings are
+    kept in NumPy arrays indexed by ball number. `step` applies the same rules as
+    `Ball.move` (reverse a direction when the next step would leave the bounds) to every
+    ball at once. Code written against Ball can still use `system[i]`, which is a
+    BallView reading and writing the arrays.
+
+    @method: add        -- add a ball, returns its index
+    @method: addBall    -- copy an existing Ball into the system
+    @method: fromBalls  -- build a system out of a list of Balls
+    @method: step       -- move every ball one step, bouncing off the bounds
+    @method: ball       -- the BallView for one ball
+    """
+
+    def __init__(self, bounds, capacity=1024):
+        self.bounds = bounds
+        self.size = 0
+
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.dx = np.zeros(capacity, dtype=np.float64)
+        self.dy = np.zeros(capacity, dtype=np.float64)
+        self.radius = np.zeros(capacity, dtype=np.float64)
+        self.bearing = np.zeros(capacity, dtype=np.float64)
+
+        # reused by step so it doesn't allocate
+        self._scratch = np.zeros(capacity, dtype=np.float64)
+        self._hit = np.zeros(capacity, dtype=bool)
+
+        self.colors = []
+        self.data = []
+        self.views = []
+
+    @classmethod
+    def fromBalls(cls, balls, bounds):
+        """Build a system holding copies of some balls.
+        Params:
+            balls (list) : Ball instances
+            bounds (Bounds) : walls the balls bounce off
+        Returns:
+            BallSystem
+        """
+        system = cls(bounds, max(len(balls), 1))
+        for ball in balls:
+            system.addBall(ball)
+        return system
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        return self.ball(i)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.views[i]
+
+    def __str__(self):
+        return "%s(balls: %s, bounds: %s)" % (
+            self.__class__.__name__,
+            self.size,
+            self.bounds,
+        )
+
+    def add(self, x, y, radius=1, velocity=1, bearing=None, color=(0, 0, 0), data=None):
+        """Add a ball heading along a bearing (random if not given).
+        Params:
+            x (float)
+            y (float)
+            radius (float)
+            velocity (float) : length of one step
+            bearing (float) : heading in radians
+            color (tuple)
+            data (dict)
+        Returns:
+            int : index of the new ball
+        """
+        if bearing is None:
+            bearing = math.radians(random.randint(0, 360))
+        # same direction Ball.destination uses
+        dx = math.sin(bearing) * velocity
+        dy = math.cos(bearing) * velocity
+        return self._append(x, y, dx, dy, radius, bearing, color, data)
+
+    def addBall(self, ball):
+        """Copy a Ball (position, step, radius, bearing, color, data) into the system.
+        Params:
+            ball (Ball)
+        Returns:
+            int : index of the new ball
+        """
+        return self._append(
+            ball.x,
+            ball.y,
+            ball.vector.dx,
+            ball.vector.dy,
+            ball.radius,
+            ball.bearing,
+            ball.color,
+            ball.data,
+        )
+
+    def ball(self, i):
+        """The view of ball i. The same view object is returned every time.
+        Params:
+            i (int)
+        Returns:
+            BallView
+        """
+        if not 0 <= i < self.size:
+            raise IndexError("ball %s out of range (%s balls)" % (i, self.size))
+        return self.views[i]
+
+    def step(self, bounds=None):
+        """Move every ball by its step. A ball whose next step would reach the bounds
+        reverses that direction first (and turns its bearing around for x), exactly like
+        Ball.move.
+        Params:
+            bounds (Bounds) : defaults to the system's bounds
+        Returns:
+            None
+        """
+        if bounds is None:
+            bounds = self.bounds
+        n = self.size
+        self._bounce(self.x[:n], self.dx[:n], bounds.minX, bounds.maxX)
+
+        # bounces are rare, only touch the bearings of the balls that hit a side wall
+        turned = np.flatnonzero(self._hit[:n])
+        if turned.size:
+            bearing = self.bearing
+            bearing[turned] = (bearing[turned] + math.pi) % (2 * math.pi)
+
+        self._bounce(self.y[:n], self.dy[:n], bounds.minY, bounds.maxY)
+
+    def _bounce(self, pos, step, low, high):
+        """
+        Advance one axis in place. The next position is outside (low, high) exactly when
+        its distance from the middle is at least half the width, which needs no
+        temporaries beyond the scratch buffers. Leaves the hit mask in self._hit.
+        """
+        n = len(pos)
+        nextPos = self._scratch[:n]
+        hit = self._hit[:n]
+        np.add(pos, step, out=nextPos)
+        np.subtract(nextPos, (low + high) / 2, out=nextPos)
+        np.abs(nextPos, out=nextPos)
+        np.greater_equal(nextPos, (high - low) / 2, out=hit)
+        np.negative(step, out=step, where=hit)
+        pos += step
+
+    def _append(self, x, y, dx, dy, radius, bearing, color, data):
+        i = self.size
+        if i == len(self.x):
+            self._grow(2 * i)
+        self.x[i] = x
+        self.y[i] = y
+        self.dx[i] = dx
+        self.dy[i] = dy
+        self.radius[i] = radius
+        self.bearing[i] = bearing
+        self.colors.append(color)
+        self.data.append(data if data is not None else {})
+        self.views.append(BallView(self, i))
+        self.size += 1
+        return i
+
+    def _grow(self, n):
+        for name in ("x", "y", "dx", "dy", "radius", "bearing", "_scratch", "_hit"):
+            old = getattr(self, name)
+            new = np.zeros(n, dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+
+class StepView(object):
+    """Stands in for a Ball's `vector`, exposing dx / dy of one ball in a BallSystem."""
+
+    __slots__ = ("system", "i")
+
+    def __init__(self, system, i):
+        self.system = system
+        self.i = i
+
+    @property
+    def dx(self):
+        return float(self.system.dx[self.i])
+
+    @dx.setter
+    def dx(self, value):
+        self.system.dx[self.i] = value
+
+    @property
+    def dy(self):
+        return float(self.system.dy[self.i])
+
+    @dy.setter
+    def dy(self, value):
+        self.system.dy[self.i] = value
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(dx:{self.dx} dy:{self.dy})"
+
+
+class BallView(object):
+    """
+    One ball of a BallSystem with the attributes of a Ball (x, y, radius, color, data,
+    bearing, vector, center), so drawing code, the quadtree and the collision code can
+    keep working with it. Reads and writes go straight to the system's arrays.
+    """
+
+    __slots__ = ("system", "i", "vector")
+
+    def __init__(self, system, i):
+        self.system = system
+        self.i = i
+        self.vector = StepView(system, i)
+
+    @property
+    def x(self):
+        return float(self.system.x[self.i])
+
+    @x.setter
+    def x(self, value):
+        self.system.x[self.i] = value
+
+    @property
+    def y(self):
+        return float(self.system.y[self.i])
+
+    @y.setter
+    def y(self, value):
+        self.system.y[self.i] = value
+
+    @property
+    def radius(self):
+        return float(self.system.radius[self.i])
+
+    @radius.setter
+    def radius(self, value):
+        self.system.radius[self.i] = value
+
+    @property
+    def bearing(self):
+        return float(self.system.bearing[self.i])
+
+    @bearing.setter
+    def bearing(self, value):
+        self.system.bearing[self.i] = value
+
+    @property
+    def color(self):
+        return self.system.colors[self.i]
+
+    @color.setter
+    def color(self, value):
+        self.system.colors[self.i] = value
+
+    @property
+    def data(self):
+        return self.system.data[self.i]
+
+    @property
+    def center(self):
+        return Point(self.x, self.y)
+
+    def asTuple(self):
+        return (self.x, self.y)
+
+    def move(self, bounds=None):
+        """Move just this ball one step, same rules as BallSystem.step."""
+        system = self.system
+        if bounds is None:
+            bounds = system.bounds
+        i = self.i
+        x = system.x[i] + system.dx[i]
+        y = system.y[i] + system.dy[i]
+        if x >= bounds.maxX or x <= bounds.minX:
+            system.dx[i] *= -1
+            system.bearing[i] = (system.bearing[i] + math.pi) % (2 * math.pi)
+        if y >= bounds.maxY or y <= bounds.minY:
+            system.dy[i] *= -1
+        system.x[i] += system.dx[i]
+        system.y[i] += system.dy[i]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(x:{self.x} y:{self.y} radius:{self.radius})"
+
+
+if __name__ == "__main__":
+    system = BallSystem(Bounds(0, 0, 700, 500))
+    for i in range(1000):
+        system.add(random.randint(1, 699), random.randint(1, 499), velocity=3)
+    for i in range(100):
+        system.step()
+    print(system)
+    print(system[0], system[0].vector)
@@ -0,0 +1,167 @@
+import random
+import numpy as np
+from ball import Ball
+from point import Point
+from rectangle import Rectangle
+from pointQuadTree import PointQuadTree
+
+"""
+Barnes-Hut forces between the points of a PointQuadTree.
+
+Every point is a body of unit mass, so a node's mass is its `count` and its center of
+mass is its `centroid` (sumX / count, sumY / count), both kept up to date by the tree.
+
+Forces are worked out one group at a time, a group being the points stored in one node.
+The tree is walked once per group: a node that is small compared to its distance from
+the group (size / distance < theta, distance measured to the group's extent) is
+accepted as a single body at its center of mass, anything closer is opened and the
+points it holds itself are used as they are. The accepted bodies are then applied to
+every point of the group at once with NumPy.
+
+The softening length keeps close encounters finite, and makes a body pull on itself
+(or on one sitting exactly on top of it) with zero force.
+
+@function: computeForces  -- Barnes-Hut acceleration of every point of a tree
+@function: directForces   -- exact O(n^2) acceleration, for checking and small sets
+@function: applyForces    -- add the accelerations to each ball's `vector`
+"""
+
+
+def computeForces(tree, theta=0.5, strength=1.0, softening=1.0):
+    """Barnes-Hut acceleration on every point of a tree.
+    Params:
+        tree (PointQuadTree) : tree holding the bodies
+        theta (float) : opening angle, 0 is exact, bigger is faster and rougher
+        strength (float) : > 0 attracts (gravity), < 0 repels
+        softening (float) : added to every distance (squared) to keep forces finite
+    Returns:
+        tuple : (points, ax, ay) every point of the tree and arrays with the
+                acceleration of each
+    """
+    points = []
+    ax = []
+    ay = []
+    eps2 = softening * softening
+    theta2 = theta * theta
+
+    for group, _ in tree.iterNodes():
+        if not group.points:
+            continue
+
+        tx = np.fromiter((p.x for p in group.points), np.float64, len(group.points))
+        ty = np.fromiter((p.y for p in group.points), np.float64, len(group.points))
+        left = tx.min()
+        right = tx.max()
+        top = ty.min()
+        bottom = ty.max()
+
+        # bodies acting on the group: single points and accepted nodes alike
+        sx = []
+        sy = []
+        sm = []
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if not node.count:
+                continue
+
+            cx = node.sumX / node.count
+            cy = node.sumY / node.count
+            size = max(node.maxX - node.minX, node.maxY - node.minY)
+            # distance from the center of mass to the closest spot of the group
+            dx = max(left - cx, 0, cx - right)
+            dy = max(top - cy, 0, cy - bottom)
+            distSq = dx * dx + dy * dy
+            if size * size < theta2 * distSq:
+                sx.append(cx)
+                sy.append(cy)
+                sm.append(node.count)
+                continue
+
+            for p in node.points:
+                sx.append(p.x)
+                sy.append(p.y)
+                sm.append(1)
+            if not node.northWest == None:
+                stack.extend(node._children())
+
+        gx, gy = _accelerate(
+            tx, ty, np.array(sx), np.array(sy), np.array(sm, np.float64), eps2
+        )
+        points.extend(group.points)
+        ax.append(gx)
+        ay.append(gy)
+
+    if not points:
+        return points, np.zeros(0), np.zeros(0)
+    return points, np.concatenate(ax) * strength, np.concatenate(ay) * strength
+
+
+def directForces(xs, ys, strength=1.0, softening=1.0):
+    """Exact acceleration of every body from all the others (unit masses).
+    Params:
+        xs (array) : x coordinates
+        ys (array) : y coordinates
+        strength (float) : > 0 attracts, < 0 repels
+        softening (float) : added to every distance (squared)
+    Returns:
+        tuple : (ax, ay) arrays
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    ax, ay = _accelerate(
+        xs, ys, xs, ys, np.ones(len(xs)), softening * softening, chunk=512
+    )
+    return ax * strength, ay * strength
+
+
+def applyForces(tree, theta=0.5, strength=1.0, softening=1.0, dt=1.0):
+    """Add each ball's Barnes-Hut acceleration (times dt) to its `vector`.
+    Params:
+        tree (PointQuadTree) : tree holding the balls
+        theta (float) : opening angle
+        strength (float) : > 0 attracts, < 0 repels
+        softening (float) : added to every distance (squared)
+        dt (float) : length of the step
+    Returns:
+        int : number of balls updated
+    """
+    points, ax, ay = computeForces(tree, theta, strength, softening)
+    ax = (ax * dt).tolist()
+    ay = (ay * dt).tolist()
+    for p, gx, gy in zip(points, ax, ay):
+        p.vector.dx += gx
+        p.vector.dy += gy
+    return len(points)
+
+
+def _accelerate(tx, ty, sx, sy, sm, eps2, chunk=None):
+    """
+    Acceleration on targets (tx, ty) from bodies (sx, sy) with masses sm. Targets are
+    done `chunk` at a time to bound the size of the target x body temporaries.
+    """
+    ax = np.zeros(len(tx))
+    ay = np.zeros(len(tx))
+    if not len(sx):
+        return ax, ay
+    step = chunk or len(tx)
+    for lo in range(0, len(tx), step):
+        dx = sx[None, :] - tx[lo : lo + step, None]
+        dy = sy[None, :] - ty[lo : lo + step, None]
+        inv = dx * dx + dy * dy + eps2
+        # m / r^3, a body on top of its target has dx = dy = 0 and adds nothing
+        inv = sm / (inv * np.sqrt(inv))
+        ax[lo : lo + step] = (dx * inv).sum(axis=1)
+        ay[lo : lo + step] = (dy * inv).sum(axis=1)
+    return ax, ay
+
+
+if __name__ == "__main__":
+    bbox = Rectangle(p1=Point(0, 0), p2=Point(1000, 1000))
+    balls = [Ball(random.random() * 1000, random.random() * 1000) for _ in range(5000)]
+    tree = PointQuadTree(bbox, 8)
+    tree.reset(balls)
+    points, ax, ay = computeForces(tree, theta=0.5)
+    ex, ey = directForces([p.x for p in points], [p.y for p in points])
+    err = np.hypot(ax - ex, ay - ey) / np.hypot(ex, ey)
+    print("%d bodies, median relative error %.4f" % (len(points), np.median(err)))
@@ -0,0 +1,302 @@
+import math
+import random
+import numpy as np
+from point import Point
+from rectangle import Rectangle
+from pointQuadTree import PointQuadTree
+from spatialJoin import nodeParts
+
+"""
+Density based clustering (DBSCAN) of the points already held in a PointQuadTree.
+
+A point is a core point when at least minPts points (itself included) lie within eps of
+it. Core points within eps of each other end up in the same cluster, points within eps
+of a core point join the cluster of the nearest one as border points, and everything
+else is noise.
+
+The work is done one group at a time, a group being a small subtree (or the points a
+bigger node holds itself). The nodes within eps of every group are found in a single
+walk of the tree, and each group's points are then measured against theirs in one go
+with NumPy. The node aggregates (count and tight extent) save most of the counting:
+
+    - a node whose points all fit in a box with a diagonal of at most eps, holding at
+      least minPts points, is dense: every point in it is a core point
+    - a node within eps of every point of a group adds its count to all of them without
+      a single distance being computed
+
+Clusters are found on a grid of cells with a diagonal of eps. The core points of one cell
+are all within eps of each other, so they always share a cluster, and only cells (not
+points) have to be linked together with a union-find.
+
+@function: dbscan -- cluster labels for the points of a tree
+"""
+
+# subtrees with at most this many points are measured as one group
+GROUP_SIZE = 256
+
+
+def dbscan(tree, eps, minPts, points=None):
+    """Cluster the points of a tree with DBSCAN.
+    Params:
+        tree (PointQuadTree) : populated tree
+        eps (float) : neighbourhood radius
+        minPts (int) : points (self included) within eps that make a core point
+        points (list) : the points to label, all of them in the tree. Defaults to
+                        list(tree.iterPoints())
+    Returns:
+        ndarray(int) : cluster label per point (numbered 0, 1, .. in order of first
+                       appearance), -1 for noise
+    """
+    if not eps > 0:
+        raise ValueError("eps must be positive, got %s" % eps)
+    everything = list(tree.iterPoints())
+    n = len(everything)
+    if points is None:
+        order = np.arange(n)
+    else:
+        index = {id(p): i for i, p in enumerate(everything)}
+        order = np.array([index[id(p)] for p in points], dtype=np.int64)
+    if not n:
+        return np.full(len(order), -1, dtype=np.int64)
+
+    xs = np.fromiter((p.x for p in everything), np.float64, n)
+    ys = np.fromiter((p.y for p in everything), np.float64, n)
+    epsSq = eps * eps
+
+    # iterPoints walks the nodes in preorder, so every subtree is one run of
+    # `everything` starting at first[id(node)]
+    first = {}
+    at = 0
+    for node, _ in tree.iterNodes():
+        first[id(node)] = at
+        at += len(node.points)
+
+    # cells with a diagonal of (just under) eps
+    side = eps / math.sqrt(2) * (1 - 1e-9)
+    col = np.floor((xs - xs.min()) / side).astype(np.int64)
+    row = np.floor((ys - ys.min()) / side).astype(np.int64)
+    _, cell = np.unique(np.stack((row, col), axis=1), axis=0, return_inverse=True)
+    cell = cell.ravel()
+    numCells = int(cell.max()) + 1
+
+    # full cells and dense nodes are all core
+    core = np.bincount(cell)[cell] >= minPts
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.count < minPts:
+            continue
+        w = node.maxX - node.minX
+        h = node.maxY - node.minY
+        if w * w + h * h <= epsSq:
+            core[first[id(node)] : first[id(node)] + node.count] = True
+        elif not node.northWest == None:
+            stack.extend(node._children())
+
+    # count neighbours, remembering what each group found for the linking below
+    found = list(_neighbourhoods(tree, xs, ys, epsSq, first))
+    for lo, hi, whole, partial in found:
+        todo = np.flatnonzero(~core[lo:hi])
+        if not todo.size:
+            continue
+        counts = sum(stop - start for start, stop in whole)
+        idx = _ranges(partial)
+        if idx.size:
+            counts = counts + _within(
+                xs[lo + todo], ys[lo + todo], xs[idx], ys[idx], epsSq
+            ).sum(axis=1)
+        core[lo + todo] = counts >= minPts
+
+    # link the cells of core points within eps of each other, and give every border
+    # point the nearest core point in reach
+    edges = []
+    border = np.full(n, -1, dtype=np.int64)
+    for lo, hi, whole, partial in found:
+        wholeIdx = _ranges(whole)
+        wholeIdx = wholeIdx[core[wholeIdx]]
+        partIdx = _ranges(partial)
+        partIdx = partIdx[core[partIdx]]
+        rows = core[lo:hi]
+
+        if rows.any():
+            rowCells = np.unique(cell[lo:hi][rows])
+            # subtrees in reach of the whole group link to every core point in it
+            wholeCells = np.unique(cell[wholeIdx])
+            a = np.repeat(rowCells, len(wholeCells))
+            b = np.tile(wholeCells, len(rowCells))
+            linked = [(a, b)]
+
+            near = partIdx
+            if len(rowCells) == 1:
+                # nothing left to learn from cells already linked to the only row cell
+                near = near[~np.isin(cell[near], wholeCells)]
+            if near.size:
+                r, c = np.nonzero(
+                    _within(xs[lo:hi][rows], ys[lo:hi][rows], xs[near], ys[near], epsSq)
+                )
+                linked.append((cell[lo:hi][rows][r], cell[near[c]]))
+
+            a = np.concatenate([pair[0] for pair in linked])
+            b = np.concatenate([pair[1] for pair in linked])
+            apart = a != b
+            if apart.any():
+                a = a[apart]
+                b = b[apart]
+                edges.append(np.unique(np.minimum(a, b) * numCells + np.maximum(a, b)))
+
+        if not rows.all():
+            idx = np.concatenate((wholeIdx, partIdx))
+            if not idx.size:
+                continue
+            loose = lo + np.flatnonzero(~rows)
+            dx = xs[loose, None] - xs[idx]
+            dy = ys[loose, None] - ys[idx]
+            distSq = dx * dx + dy * dy
+            within = distSq <= epsSq
+            reached = within.any(axis=1)
+            if reached.any():
+                nearest = np.where(within[reached], distSq[reached], np.inf).argmin(
+                    axis=1
+                )
+                border[loose[reached]] = idx[nearest]
+
+    parent = list(range(numCells))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if edges:
+        for key in np.unique(np.concatenate(edges)).tolist():
+            i = find(key // numCells)
+            j = find(key % numCells)
+            if i != j:
+                parent[j] = i
+    roots = np.array([find(i) for i in range(numCells)], dtype=np.int64)
+
+    # a point's cluster is the root of its own cell, or of its core point's cell
+    owner = np.where(core, np.arange(n), border)[order]
+    labels = np.full(len(order), -1, dtype=np.int64)
+    hit = owner >= 0
+    clusters = roots[cell[owner[hit]]]
+    # number the clusters in order of first appearance
+    _, firstSeen, inverse = np.unique(clusters, return_index=True, return_inverse=True)
+    rank = np.empty(len(firstSeen), dtype=np.int64)
+    rank[np.argsort(firstSeen)] = np.arange(len(firstSeen))
+    labels[hit] = rank[inverse.ravel()]
+    return labels
+
+
+def _neighbourhoods(tree, xs, ys, epsSq, first):
+    """
+    Find the nodes within eps of every group of points, as runs of the preorder point
+    list. A group is a subtree of at most GROUP_SIZE points, or the points a bigger node
+    holds itself. Yields (lo, hi, whole, partial): the group is the run lo:hi, `whole`
+    runs are within eps of every point of the group, `partial` runs only partly.
+
+    The tree is walked once as the target side. Each target passes the source nodes it
+    couldn't settle down to its parts, so the nodes near the top are only looked at
+    once instead of once per group. Settled subtrees are kept as a chain of lists shared
+    by everything below.
+    """
+    # (target, whole target?, unsettled sources, (whole runs, parent chain))
+    stack = [(tree, True, [(tree, True)], None)]
+    while stack:
+        target, targetWhole, sources, chain = stack.pop()
+        if targetWhole:
+            left = target.minX
+            top = target.minY
+            right = target.maxX
+            bottom = target.maxY
+            size = max(right - left, bottom - top)
+            splits = not target.northWest == None and target.count > GROUP_SIZE
+        else:
+            lo = first[id(target)]
+            hi = lo + len(target.points)
+            left = xs[lo:hi].min()
+            top = ys[lo:hi].min()
+            right = xs[lo:hi].max()
+            bottom = ys[lo:hi].max()
+            splits = False
+
+        whole = []
+        unsettled = []
+        while sources:
+            node, nodeWhole = sources.pop()
+            dx = max(node.minX - right, 0, left - node.maxX)
+            dy = max(node.minY - bottom, 0, top - node.maxY)
+            if dx * dx + dy * dy > epsSq:
+                continue
+
+            start = first[id(node)]
+            stop = start + (node.count if nodeWhole else len(node.points))
+            dx = max(right - node.minX, node.maxX - left)
+            dy = max(bottom - node.minY, node.maxY - top)
+            if dx * dx + dy * dy <= epsSq:
+                whole.append((start, stop))
+                continue
+
+            # open the source if the target won't be split any further, or if it is
+            # the bigger of the two
+            if (
+                nodeWhole
+                and not node.northWest == None
+                and (
+                    not splits
+                    or max(node.maxX - node.minX, node.maxY - node.minY) >= size
+                )
+            ):
+                sources.extend(nodeParts(node))
+            else:
+                unsettled.append((node, nodeWhole))
+
+        if whole:
+            chain = (whole, chain)
+
+        if splits:
+            for part, partWhole in nodeParts(target):
+                stack.append((part, partWhole, list(unsettled), chain))
+            continue
+
+        runs = []
+        while chain is not None:
+            runs.extend(chain[0])
+            chain = chain[1]
+        partial = []
+        for node, nodeWhole in unsettled:
+            start = first[id(node)]
+            partial.append((start, start + len(node.points)))
+        lo = first[id(target)]
+        yield lo, lo + (
+            target.count if targetWhole else len(target.points)
+        ), runs, partial
+
+
+def _ranges(runs):
+    """Concatenate (start, stop) runs into one index array."""
+    if not runs:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([np.arange(start, stop) for start, stop in runs])
+
+
+def _within(x, y, px, py, epsSq):
+    """(len(x), len(px)) mask of the pairs within eps of each other."""
+    dx = x[:, None] - px
+    dy = y[:, None] - py
+    return dx * dx + dy * dy <= epsSq
+
+
+if __name__ == "__main__":
+    bbox = Rectangle(p1=Point(0, 0), p2=Point(1000, 1000))
+    tree = PointQuadTree(bbox, 8)
+    points = []
+    for cx, cy in ((200, 200), (700, 300), (500, 800)):
+        for i in range(1000):
+            points.append(Point(random.gauss(cx, 30), random.gauss(cy, 30)))
+    for i in range(300):
+        points.append(Point(random.random() * 1000, random.random() * 1000))
+    tree.reset(points)
+    labels = dbscan(tree, 15, 10)
+    print(labels.max() + 1, "clusters,", (labels < 0).sum(), "noise points")
@@ -0,0 +1,112 @@
+import math
+import random
+from ball import Ball
+from point import Point
+from rectangle import Rectangle
+from pointQuadTree import PointQuadTree
+
+"""
+Collision detection for balls stored in a PointQuadTree.
+
+Broad phase: every ball asks the tree for the balls whose centers are close enough to
+possibly touch it (its own radius plus the biggest radius around), which only opens
+the quadrants near the ball.
+
+Narrow phase: each candidate pair gets an exact circle - circle test, and pairs that
+really overlap get an elastic bounce that updates both balls' `vector`.
+
+@function: findCollisions    -- pairs of overlapping balls, each pair once
+@function: resolveCollision  -- elastic bounce for one pair
+@function: handleCollisions  -- find and resolve everything for a frame
+"""
+
+
+def findCollisions(tree, balls):
+    """Find every pair of overlapping balls.
+    Params:
+        tree (PointQuadTree) : tree holding the balls
+        balls (list) : the balls to check, all of them in the tree
+    Returns:
+        list : (ball, ball) tuples, each overlapping pair reported once
+    """
+    if not balls:
+        return []
+
+    maxRadius = max(b.radius for b in balls)
+    order = {id(b): i for i, b in enumerate(balls)}
+    pairs = []
+
+    for i, a in enumerate(balls):
+        for b in tree.searchRadius(a, a.radius + maxRadius):
+            # only keep the pair from the ball that comes first
+            j = order.get(id(b))
+            if j is None or j <= i:
+                continue
+
+            dx = b.x - a.x
+            dy = b.y - a.y
+            reach = a.radius + b.radius
+            if dx * dx + dy * dy <= reach * reach:
+                pairs.append((a, b))
+
+    return pairs
+
+
+def resolveCollision(a, b):
+    """Bounce two touching balls off each other (elastic, mass grows with area).
+    Params:
+        a (Ball)
+        b (Ball)
+    Returns:
+        bool : False if the balls were already moving apart
+    """
+    dx = b.x - a.x
+    dy = b.y - a.y
+    dist = math.sqrt(dx * dx + dy * dy)
+    if dist == 0:
+        return False
+
+    # unit normal from a to b
+    nx = dx / dist
+    ny = dy / dist
+
+    # speed of each ball along the normal
+    va = a.vector.dx * nx + a.vector.dy * ny
+    vb = b.vector.dx * nx + b.vector.dy * ny
+    if va - vb <= 0:
+        return False
+
+    ma = a.radius * a.radius
+    mb = b.radius * b.radius
+    impulse = 2 * (va - vb) / (ma + mb)
+
+    a.vector.dx -= impulse * mb * nx
+    a.vector.dy -= impulse * mb * ny
+    b.vector.dx += impulse * ma * nx
+    b.vector.dy += impulse * ma * ny
+    return True
+
+
+def handleCollisions(tree, balls):
+    """Find every overlapping pair and bounce them.
+    Params:
+        tree (PointQuadTree) : tree holding the balls
+        balls (list) : the balls to check
+    Returns:
+        list : the (ball, ball) pairs that collided
+    """
+    pairs = findCollisions(tree, balls)
+    for a, b in pairs:
+        resolveCollision(a, b)
+    return pairs
+
+
+if __name__ == "__main__":
+    bbox = Rectangle(p1=Point(0, 0), p2=Point(200, 200))
+    tree = PointQuadTree(bbox, 4)
+    balls = []
+    for i in range(200):
+        b = Ball(random.randint(0, 200), random.randint(0, 200), radius=5)
+        tree.insert(b)
+        balls.append(b)
+    print(len(handleCollisions(tree, balls)), "collisions")
@@ -0,0 +1,200 @@
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+from rich import print
+from point import Point
+from rectangle import Rectangle
+from arrayQuadTree import ArrayQuadTree
+
+"""
+Streaming ingestion of point files into a quadtree.
+
+Readers are generators that parse a file a fixed number of rows at a time and yield
+every chunk as coordinate arrays (xs, ys, ids, bytesRead), so no more than one chunk of
+the file is ever held in memory. `ingest` feeds the chunks into a tree's batch insert
+(ArrayQuadTree.insertArrays) and reports how far it got and how fast.
+
+Supported inputs:
+
+    - CSV with a header row, columns picked by name
+    - JSON lines, one object per row, fields picked by name
+    - raw binary records (NumPy dtype, default two little endian float64s x, y)
+
+@function: readCSV      -- chunks of a CSV file
+@function: readJSONL    -- chunks of a JSON lines file
+@function: readBinary   -- chunks of a raw binary file
+@function: readFile     -- pick the reader by file extension
+@function: ingest       -- insert chunks into a tree, reporting progress
+@function: ingestFile   -- readFile + ingest with the file size as the total
+@function: printProgress -- default progress report
+"""
+
+# rows per chunk unless told otherwise
+CHUNK_ROWS = 100000
+
+# what a raw binary file holds unless told otherwise
+BINARY_DTYPE = np.dtype([("x", "<f8"), ("y", "<f8")])
+
+
+def readCSV(path, chunkRows=CHUNK_ROWS, x="x", y="y", id=None, delimiter=","):
+    """Read a CSV file with a header row in chunks.
+    Params:
+        path (str) : file to read
+        chunkRows (int) : rows per chunk
+        x (str) : name of the x column
+        y (str) : name of the y column
+        id (str) : name of an integer id column, None to leave ids out
+        delimiter (str) : field separator
+    Returns:
+        generator : (xs, ys, ids or None, bytesRead) tuples
+    """
+    with open(path, "rb") as f:
+        header = f.readline().decode().strip().split(delimiter)
+        names = [x, y] + ([id] if id is not None else [])
+        missing = [name for name in names if name not in header]
+        if missing:
+            raise ValueError("%s has no column(s) %s" % (path, ", ".join(missing)))
+        columns = [header.index(name) for name in names]
+
+        while True:
+            lines = list(itertools.islice(f, chunkRows))
+            if not lines:
+                return
+            rows = np.loadtxt(
+                [line.decode() for line in lines],
+                delimiter=delimiter,
+                usecols=columns,
+                ndmin=2,
+            )
+            ids = rows[:, 2].astype(np.int64) if id is not None else None
+            yield rows[:, 0], rows[:, 1], ids, f.tell()
+
+
+def readJSONL(path, chunkRows=CHUNK_ROWS, x="x", y="y", id=None):
+    """Read a JSON lines file (one object per line) in chunks.
+    Params:
+        path (str) : file to read
+        chunkRows (int) : rows per chunk
+        x (str) : key of the x value
+        y (str) : key of the y value
+        id (str) : key of an integer id, None to leave ids out
+    Returns:
+        generator : (xs, ys, ids or None, bytesRead) tuples
+    """
+    with open(path, "rb") as f:
+        while True:
+            lines = list(itertools.islice(f, chunkRows))
+            if not lines:
+                return
+            rows = [json.loads(line) for line in lines if line.strip()]
+            xs = np.fromiter((row[x] for row in rows), np.float64, len(rows))
+            ys = np.fromiter((row[y] for row in rows), np.float64, len(rows))
+            ids = None
+            if id is not None:
+                ids = np.fromiter((row[id] for row in rows), np.int64, len(rows))
+            yield xs, ys, ids, f.tell()
+
+
+def readBinary(path, chunkRows=CHUNK_ROWS, dtype=BINARY_DTYPE, x="x", y="y", id=None):
+    """Read a file of fixed size binary records in chunks.
+    Params:
+        path (str) : file to read
+        chunkRows (int) : records per chunk
+        dtype (np.dtype) : structured dtype of one record
+        x (str) : field holding x
+        y (str) : field holding y
+        id (str) : field holding an integer id, None to leave ids out
+    Returns:
+        generator : (xs, ys, ids or None, bytesRead) tuples
+    """
+    dtype = np.dtype(dtype)
+    with open(path, "rb") as f:
+        while True:
+            rows = np.fromfile(f, dtype=dtype, count=chunkRows)
+            if not len(rows):
+                return
+            ids = rows[id].astype(np.int64) if id is not None else None
+            yield (
+                rows[x].astype(np.float64),
+                rows[y].astype(np.float64),
+                ids,
+                f.tell(),
+            )
+
+
+def readFile(path, chunkRows=CHUNK_ROWS, **options):
+    """Read a .csv, .jsonl (or .json / .ndjson) or raw binary (anything else) file in
+    chunks, passing any options on to the reader.
+    Returns:
+        generator : (xs, ys, ids or None, bytesRead) tuples
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return readCSV(path, chunkRows, **options)
+    if extension in (".jsonl", ".json", ".ndjson"):
+        return readJSONL(path, chunkRows, **options)
+    return readBinary(path, chunkRows, **options)
+
+
+def ingest(tree, chunks, total=None, report=None):
+    """Insert chunks of points into a tree as they come.
+    Params:
+        tree (ArrayQuadTree) : anything with insertArrays(xs, ys, ids)
+        chunks (iterable) : (xs, ys, ids, bytesRead) tuples, like the readers yield
+        total (int) : size of the input in bytes, for the percentage
+        report (callable) : called with the progress dict after every chunk
+    Returns:
+        dict : final progress: rows read, rows inserted (inside the bbox), bytes read,
+               total bytes, seconds and rows per second
+    """
+    began = time.perf_counter()
+    progress = {
+        "rows": 0,
+        "inserted": 0,
+        "bytes": 0,
+        "total": total,
+        "seconds": 0.0,
+        "rowsPerSecond": 0.0,
+    }
+    for xs, ys, ids, bytesRead in chunks:
+        progress["inserted"] += tree.insertArrays(xs, ys, ids)
+        progress["rows"] += len(xs)
+        progress["bytes"] = bytesRead
+        progress["seconds"] = time.perf_counter() - began
+        progress["rowsPerSecond"] = progress["rows"] / max(progress["seconds"], 1e-9)
+        if report is not None:
+            report(progress)
+    return progress
+
+
+def ingestFile(tree, path, chunkRows=CHUNK_ROWS, report=None, **options):
+    """Stream a whole file into a tree (see readFile and ingest).
+    Returns:
+        dict : final progress
+    """
+    chunks = readFile(path, chunkRows, **options)
+    return ingest(tree, chunks, os.path.getsize(path), report)
+
+
+def printProgress(progress):
+    """Print one line of progress: rows, percentage of the input and rows per second."""
+    done = ""
+    if progress["total"]:
+        done = " (%.1f%%)" % (100.0 * progress["bytes"] / progress["total"])
+    print(
+        "%d rows%s, %d inserted, %.0f rows/s"
+        % (progress["rows"], done, progress["inserted"], progress["rowsPerSecond"])
+    )
+
+
+if __name__ == "__main__":
+    # usage: python ingest.py points.csv [width height]
+    path = sys.argv[1]
+    width = float(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    height = float(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    tree = ArrayQuadTree(Rectangle(p1=Point(0, 0), p2=Point(width, height)))
+    ingestFile(tree, path, report=printProgress)
+    print(tree)
@@ -5,7 +5,10 @@ from ball import Ball
 import random
 from rectangle import Rectangle
 from rectangle import Bounds
-from pointQuadTree import PointQuadTree
+from pointQuadTree import PointQuadTree, MAX_DEPTH
+from spatialHashGrid import SpatialHashGrid
+from collisions import handleCollisions
+from barnesHut import applyForces
 import sys
 
 # --- Global constants ---
@@ -41,9 +44,18 @@ class TreeDriver(object):
         self.primePoints = kwargs.get("primePoints", 0)  # prime tree with N points
         self.loadPoints = kwargs.get("loadPoints", [])  # load a list of points
         self.ballColor = kwargs.get("ballColor", (0, 255, 0))  # generic ball color
+        self.gravity = kwargs.get("gravity", None)  # Barnes-Hut strength (None = off)
+        self.theta = kwargs.get("theta", 0.5)  # Barnes-Hut opening angle
+        self.maxPoints = kwargs.get("maxPoints", 1)  # points per node before a split
+        self.maxDepth = kwargs.get("maxDepth", MAX_DEPTH)  # deepest level of the tree
+        self.backend = kwargs.get("backend", "quadtree")  # "quadtree" or "grid"
+        self.cellSize = kwargs.get(
+            "cellSize", None
+        )  # grid cell size (None = from the balls' radius)
 
         self.bbox = Rectangle(p1=Point(0, 0), p2=Point(self.width, self.height))
-        self.tree = PointQuadTree(self.bbox, 1, 0)
+        self.bounds = Bounds(0, 0, self.width, self.height)
+        self.tree = self.makeIndex()
         self.pid = 0
         self.balls = []
         self.rects = []
@@ -55,8 +67,25 @@ class TreeDriver(object):
         elif self.primePoints > 0:
             self.initPoints(self.primePoints)
 
+    def makeIndex(self, radius=None):
+        """Create the spatial index the balls live in, as picked by `backend`.
+        Params:
+            radius (float) : typical ball radius, sizes the grid's cells when no
+                             cellSize was given
+        Returns:
+            PointQuadTree or SpatialHashGrid
+        """
+        if self.backend == "quadtree":
+            return PointQuadTree(self.bbox, self.maxPoints, 0, self.maxDepth)
+        if self.backend == "grid":
+            if self.gravity:
+                raise ValueError("Barnes-Hut gravity needs the quadtree backend")
+            return SpatialHashGrid(self.bbox, self.cellSize, radius=radius)
+        raise ValueError("Unknown backend: %s" % self.backend)
+
     def initPoints(self, points):
         """Load quadtree with any pre-existing points"""
+        first = len(self.balls)
 
         # if points == int then we load "points" number of balls into the tree
         if isinstance(points, int):
@@ -66,7 +95,6 @@ class TreeDriver(object):
                 p = Ball(
                     x, y, data={"id": self.pid}, color=self.color, radius=3, dx=3, dy=3
                 )
-                self.tree.insert(p)
                 self.balls.append(p)
                 self.pid += 1
         # else if points is a "list" of points or balls, we handle that as well
@@ -74,14 +102,20 @@ class TreeDriver(object):
             for p in points:
                 if isinstance(p, Ball):
                     p.data["id"] = self.pid
-                    self.tree.insert(p)
-                    self.balls.append(p)
                 elif isinstance(p, Point):
                     p.data["id"] = self.pid
                     p = Ball(p.x, p.y, data=p.data)
-                self.tree.insert(p)
                 self.balls.append(p)
                 self.pid += 1
+
+        if self.backend == "grid" and self.cellSize is None and self.balls:
+            # now the balls exist, size the grid's cells from their median radius
+            radii = sorted(ball.radius for ball in self.balls)
+            self.tree = self.makeIndex(radii[len(radii) // 2])
+            self.tree.reset(self.balls)
+        else:
+            for ball in self.balls[first:]:
+                self.tree.insert(ball)
         self.rects = self.tree.getBBoxes()
 
     def captureEvents(self):
@@ -122,13 +156,23 @@ class TreeDriver(object):
         """
         if "mouseUp" in events:
             x, y = events["data"]
-            self.balls.append(Ball(x, y, radius=5, color=(128, 0, 128)))
+            ball = Ball(x, y, radius=5, color=(128, 0, 128))
+            self.tree.insert(ball)
+            self.balls.append(ball)
         # print(events)
-        # Move all the balls or sprites
+        # pull (or push) the balls toward each other before they move
+        if self.gravity:
+            applyForces(self.tree, self.theta, self.gravity, softening=5)
 
-        # check for collision
+        # Move all the balls or sprites, the tree only restructures
+        # around the ones that crossed into another quadrant
+        for ball in self.balls:
+            x, y = ball.x, ball.y
+            ball.move(self.bounds)
+            self.tree.update(ball, x, y)
 
-        # handle collisions or stuff
+        # check for collision and bounce the balls that hit each other
+        handleCollisions(self.tree, self.balls)
 
     def displayFrame(self):
         """Display everything to the screen for the game.
@@ -138,7 +182,7 @@ class TreeDriver(object):
         self.screen.fill(WHITE)
         # points = self.tree.points
 
-        self.tree.reset(self.balls)
+        self.rects = self.tree.getBBoxes()
 
         self.drawBalls()
         self.drawRects()
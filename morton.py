@@ -0,0 +1,208 @@
+import numpy as np
+
+"""
+Z-order (Morton) helpers used to bulk load the quadtrees.
+
+Interleaving the bits of the x and y cells of a point gives every point a key
+whose 2 bit digits, read from the top, are the quadrants it falls in at each level of
+the tree. Sorting on that key puts the points of every node in one contiguous run, so a
+whole tree can be cut out of the sorted array without inserting points one at a time.
+
+A digit is 2 * south + east:
+
+    0 = NW   1 = NE
+    2 = SW   3 = SE
+"""
+
+# most bits per axis that still fit two axes in a uint64 key
+MAX_BITS = 32
+
+# digit -> child slot, trees keep their children in NE, SE, SW, NW order
+DIGIT_TO_CHILD = (3, 0, 2, 1)
+
+
+def _spread(v):
+    """Spread the low 32 bits of v out so there is a zero bit between each of them."""
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def _halve(values, low, high, bits):
+    """
+    Cell of every value along one axis after `bits` halvings of [low, high]. Each bit
+    comes from the same `value >= (low + high) / 2` test the trees use to pick a child,
+    so a key never disagrees with the bounds of the nodes cut at those midpoints.
+    """
+    low = np.full(len(values), low, dtype=np.float64)
+    high = np.full(len(values), high, dtype=np.float64)
+    cells = np.zeros(len(values), dtype=np.uint64)
+    for _ in range(bits):
+        mid = (low + high) / 2
+        upper = values >= mid
+        cells <<= np.uint64(1)
+        cells |= upper
+        np.copyto(low, mid, where=upper)
+        np.copyto(high, mid, where=~upper)
+    return cells
+
+
+def _quantize(values, low, high, bits):
+    """
+    Same cells as _halve, but scaled and floored for speed. The midpoints drift from
+    low + i * span / 2**bits by a few ulps, so values that close to a cell edge may be
+    one cell off and are worked out again by _halve.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    cells = 2**bits
+    span = high - low
+    slack = 2 * (bits + 4) * np.finfo(np.float64).eps * max(abs(low), abs(high), span)
+    if span <= 0 or slack * cells / span >= 0.5:
+        return _halve(values, low, high, bits)
+    scaled = (values - low) / span * cells
+    q = np.floor(scaled)
+    edge = np.flatnonzero(np.abs(scaled - np.round(scaled)) <= slack * cells / span)
+    q = np.clip(q, 0, cells - 1).astype(np.uint64)
+    q[edge] = _halve(values[edge], low, high, bits)
+    return q
+
+
+def mortonKeys(xs, ys, bounds, bits):
+    """Morton keys for arrays of coordinates.
+    Params:
+        xs (array)
+        ys (array)
+        bounds (tuple) : left, top, right, bottom of the area being keyed
+        bits (int) : levels of the tree the key can describe (max 32)
+    Returns:
+        ndarray(uint64) : one key per point
+    """
+    l, t, r, b = bounds
+    qx = _quantize(xs, l, r, bits)
+    qy = _quantize(ys, t, b, bits)
+    return _spread(qx) | (_spread(qy) << np.uint64(1))
+
+
+def buildLinear(xs, ys, bounds, maxPoints, maxDepth):
+    """Lay out a whole quadtree over the given points from their sorted Morton keys.
+
+    Nodes are cut out of the sorted key array one level at a time; every node that holds
+    more than maxPoints points (and is above maxDepth) gets its four children, whose runs
+    are found with a binary search for the next key prefixes. Nodes whose points all
+    share one key stay leaves no matter how many they hold. Points only live in leaves
+    and every leaf's points are a contiguous run of `order`.
+
+    Params:
+        xs (array)
+        ys (array)
+        bounds (tuple) : left, top, right, bottom of the root
+        maxPoints (int) : leaf capacity
+        maxDepth (int) : leaves at this depth are never split
+    Returns:
+        tuple : (order, bounds, children, depth, start, count) where `order` is the
+                point indexes sorted by key, `children` is (nodes, 4) in NE, SE, SW, NW
+                order with -1 for leaves, and a leaf's points are
+                order[start:start + count]
+    """
+    bits = max(1, min(maxDepth, MAX_BITS))
+    keys = mortonKeys(xs, ys, bounds, bits)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+
+    allBounds = []
+    allChildren = []
+    allDepth = []
+    allStart = []
+    allCount = []
+
+    # current level of the tree
+    nodes = np.zeros(1, dtype=np.int64)
+    lo = np.zeros(1, dtype=np.int64)
+    hi = np.full(1, len(order), dtype=np.int64)
+    prefix = np.zeros(1, dtype=np.uint64)
+    box = np.array([bounds], dtype=np.float64)
+    numNodes = 1
+    depth = 0
+
+    while nodes.size:
+        count = hi - lo
+        split = (count > maxPoints) & (depth < min(maxDepth, bits))
+        if split.any():
+            # a run of identical keys can't be told apart by splitting, leave it a bucket
+            last = len(keys) - 1
+            split &= keys[np.minimum(lo, last)] != keys[np.maximum(hi - 1, 0)]
+        children = np.full((len(nodes), 4), -1, dtype=np.int64)
+
+        allBounds.append(box)
+        allChildren.append(children)
+        allDepth.append(np.full(len(nodes), depth, dtype=np.int64))
+        allStart.append(np.where(split, 0, lo))
+        allCount.append(np.where(split, 0, count))
+
+        if not split.any():
+            break
+
+        parents = np.flatnonzero(split)
+        k = len(parents)
+        shift = np.uint64(2 * (bits - depth - 1))
+
+        # every parent gets 4 children, one per digit, numbered in digit order
+        childPrefix = (prefix[parents][:, None] << np.uint64(2)) + np.arange(
+            4, dtype=np.uint64
+        )
+        childLo = np.searchsorted(keys, (childPrefix << shift).ravel()).reshape(k, 4)
+        childLo[:, 0] = lo[parents]
+        childHi = np.empty_like(childLo)
+        childHi[:, :3] = childLo[:, 1:]
+        childHi[:, 3] = hi[parents]
+
+        childIds = numNodes + np.arange(4 * k, dtype=np.int64).reshape(k, 4)
+        for digit in range(4):
+            children[parents, DIGIT_TO_CHILD[digit]] = childIds[:, digit]
+        numNodes += 4 * k
+
+        l, t, r, b = box[parents].T
+        mX = (l + r) / 2
+        mY = (t + b) / 2
+        childBox = np.empty((k, 4, 4), dtype=np.float64)
+        childBox[:, 0] = np.stack((l, t, mX, mY), axis=1)  # NW
+        childBox[:, 1] = np.stack((mX, t, r, mY), axis=1)  # NE
+        childBox[:, 2] = np.stack((l, mY, mX, b), axis=1)  # SW
+        childBox[:, 3] = np.stack((mX, mY, r, b), axis=1)  # SE
+
+        nodes = childIds.ravel()
+        lo = childLo.ravel()
+        hi = childHi.ravel()
+        prefix = childPrefix.ravel()
+        box = childBox.reshape(4 * k, 4)
+        depth += 1
+
+    allBounds = np.concatenate(allBounds)
+    allStart = np.concatenate(allStart)
+    allCount = np.concatenate(allCount)
+    _checkLeaves(xs, ys, order, allBounds, allStart, allCount)
+    return (
+        order,
+        allBounds,
+        np.concatenate(allChildren),
+        np.concatenate(allDepth),
+        allStart,
+        allCount,
+    )
+
+
+def _checkLeaves(xs, ys, order, bounds, start, count):
+    """Raise ValueError if a point was cut into a leaf whose bounds don't hold it."""
+    leaves = np.flatnonzero(count)
+    leaves = leaves[np.argsort(start[leaves])]
+    l, t, r, b = bounds[np.repeat(leaves, count[leaves])].T
+    x = np.asarray(xs, dtype=np.float64)[order]
+    y = np.asarray(ys, dtype=np.float64)[order]
+    outside = (x < l) | (x > r) | (y < t) | (y > b)
+    if outside.any():
+        raise ValueError(
+            "%d points ended up outside the bounds of their leaf" % outside.sum()
+        )
@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from point import Point
+from rectangle import Rectangle
+from morton import mortonKeys, buildLinear, DIGIT_TO_CHILD
+from arrayQuadTree import ArrayQuadTree
+from pointQuadTree import MAX_DEPTH
+
+"""
+Parallel bulk load of an ArrayQuadTree over a pool of processes.
+
+The root bbox is cut into the 4^level cells of a fixed level of the tree. The points
+are bucketed by cell with one linear pass (their Morton key at that level), the top of
+the tree is laid out from the cell counts alone, and every cell that still has to be
+split is handed to a worker process, which builds its subtree with morton.buildLinear.
+
+Only coordinate arrays go to the workers and only the flat node / order arrays come
+back, which the parent splices under the top of the tree (ArrayQuadTree._graft). The
+nodes are cut at the same midpoints as a serial bulk load, so the result answers every
+query exactly like ArrayQuadTree.fromArrays.
+
+@function: buildParallel -- bulk load a tree using a process pool
+"""
+
+
+def buildParallel(
+    bbox, xs, ys, ids=None, maxPoints=8, maxDepth=MAX_DEPTH, workers=None, level=None
+):
+    """Build an ArrayQuadTree from coordinate arrays with several processes.
+    Params:
+        bbox (Rectangle) : bounds of the tree
+        xs (array) : x coordinates
+        ys (array) : y coordinates
+        ids (array) : integer id per point, defaults to the array index
+        maxPoints (int) : leaf capacity
+        maxDepth (int) : leaves at this depth are never split
+        workers (int) : processes to use, defaults to the number of CPUs
+        level (int) : depth of the cells handed out, defaults to the shallowest level
+                      with at least 4 cells per worker (at most 8)
+    Returns:
+        ArrayQuadTree
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if level is None:
+        level = 1
+        while 4**level < 4 * workers and level < 8:
+            level += 1
+    level = max(1, min(level, 8, maxDepth))
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if ids is None:
+        ids = np.arange(len(xs), dtype=np.int64)
+    else:
+        ids = np.asarray(ids, dtype=np.int64)
+    inside = (
+        (xs >= bbox.left) & (xs <= bbox.right) & (ys >= bbox.top) & (ys <= bbox.bottom)
+    )
+    if not inside.all():
+        xs, ys, ids = xs[inside], ys[inside], ids[inside]
+
+    tree = ArrayQuadTree(bbox, maxPoints, maxDepth)
+    n = len(xs)
+    tree._ensurePoints(n)
+    tree.xs[:n] = xs
+    tree.ys[:n] = ys
+    tree.ids[:n] = ids
+    tree.numPoints = n
+
+    # bucket the points by cell, keys of at most 16 bits sort in linear time
+    bounds = (bbox.left, bbox.top, bbox.right, bbox.bottom)
+    cells = mortonKeys(xs, ys, bounds, level).astype(np.uint16)
+    order = np.argsort(cells, kind="stable")
+    counts = np.bincount(cells, minlength=4**level)
+    firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    # lay out the top of the tree, collect the cells that need a subtree
+    jobs = []
+    stack = [(0, 0, 0)]  # (node, depth, key prefix)
+    while stack:
+        node, depth, prefix = stack.pop()
+        shift = 2 * (level - depth)
+        lo = prefix << shift
+        hi = (prefix + 1) << shift
+        total = int(counts[lo:hi].sum())
+        points = order[firsts[lo] : firsts[lo] + total]
+
+        if total <= maxPoints:
+            tree._reserve(node, total)
+            tree.slots[tree.nodeStart[node] : tree.nodeStart[node] + total] = points
+            tree.nodeCount[node] = total
+            continue
+        if depth == level:
+            jobs.append((node, points))
+            continue
+
+        l, t, r, b = tree.nodeBounds[node]
+        mX = (l + r) / 2
+        mY = (t + b) / 2
+        quads = (
+            (l, t, mX, mY),  # digit 0 = NW
+            (mX, t, r, mY),  # digit 1 = NE
+            (l, mY, mX, b),  # digit 2 = SW
+            (mX, mY, r, b),  # digit 3 = SE
+        )
+        for digit, (cl, ct, cr, cb) in enumerate(quads):
+            child = tree._newNode(cl, ct, cr, cb, depth + 1)
+            tree.nodeChildren[node, DIGIT_TO_CHILD[digit]] = child
+            stack.append((child, depth + 1, (prefix << 2) + digit))
+
+    # biggest cells first so the pool stays busy to the end, a few per round trip
+    jobs.sort(key=lambda job: -len(job[1]))
+    tasks = [
+        (
+            tree.xs[points],
+            tree.ys[points],
+            tuple(tree.nodeBounds[node]),
+            maxPoints,
+            maxDepth - level,
+        )
+        for node, points in jobs
+    ]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunk = max(1, len(tasks) // (4 * workers))
+            results = pool.map(_buildCell, tasks, chunksize=chunk)
+            for (node, points), built in zip(jobs, results):
+                tree._graft(node, points, built)
+    else:
+        for (node, points), task in zip(jobs, tasks):
+            tree._graft(node, points, _buildCell(task))
+    return tree
+
+
+def _buildCell(task):
+    """Worker side: lay out the subtree of one cell (see morton.buildLinear)."""
+    xs, ys, bounds, maxPoints, maxDepth = task
+    return buildLinear(xs, ys, bounds, maxPoints, maxDepth)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    bbox = Rectangle(p1=Point(0, 0), p2=Point(1000, 1000))
+    xs = np.random.random(n) * 1000
+    ys = np.random.random(n) * 1000
+
+    began = time.perf_counter()
+    ArrayQuadTree.fromArrays(bbox, xs, ys)
+    print("serial   %.2fs" % (time.perf_counter() - began))
+
+    began = time.perf_counter()
+    tree = buildParallel(bbox, xs, ys)
+    print("parallel %.2fs on %d cpus" % (time.perf_counter() - began, os.cpu_count()))
+    print(tree)
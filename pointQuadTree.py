@@ -4,7 +4,15 @@
 from rich import print
 from point import Point
 from rectangle import *
+from morton import buildLinear
+from polygon import INSIDE, OUTSIDE
+import numpy as np
+import heapq
+import itertools
+from collections import OrderedDict
+import math
 import random
+import time
 from random import choice
 
 # width = 1024
@@ -78,16 +86,39 @@ colorDict = {
 
 colorList = list(colorDict.values())
 
+# default deepest level a tree splits down to, leaves there are unbounded buckets
+MAX_DEPTH = 24
+
+# what an iterNodes predicate can say about a node
+SKIP = 0
+VISIT = 1
+ACCEPT = 2
+
+# default number of query results a PointQuadTree cache keeps
+CACHE_SIZE = 128
+
+# results of PointQuadTree._relocate
+NOT_FOUND = 0
+SETTLED = 1
+MOVED = 2
+
 
 class PointQuadTree(object):
-    def __init__(self, bbox, maxPoints, parent=0):
+    def __init__(self, bbox, maxPoints, parent=0, maxDepth=MAX_DEPTH):
         self.maxPoints = maxPoints
+        self.maxDepth = maxDepth
         self.parent = parent
         self.bboxOriginal = bbox
         self.bbox = bbox
-        self.color = colorList[self.parent]
+        self.color = colorList[self.parent % len(colorList)]
         self.points = []
 
+        # change counters for the query cache (see enableCache): version counts changes
+        # anywhere under this node, localVersion changes to its own points or quadrants
+        self.version = 0
+        self.localVersion = 0
+        self.cache = None
+
         self.init()
 
     def init(self):
@@ -99,9 +130,23 @@ class PointQuadTree(object):
         self.bbox = self.bboxOriginal
         self.points = []
 
+        # aggregates over every point under this node
+        self.count = 0
+        self.sumX = 0.0
+        self.sumY = 0.0
+        self.minX = math.inf
+        self.minY = math.inf
+        self.maxX = -math.inf
+        self.maxY = -math.inf
+
+        self.version += 1
+        self.localVersion += 1
+        if self.cache is not None:
+            self.cache.clear()
+
     def __str__(self):
         return (
-            "\nnorthwest: %s,\nnorthEast: %s,\nsouthWest: %s,\nsouthEast: %s,\npoints: %s,\nbbox: %s,\nmaxPoints: %s,\nparent: %s"
+            "\nnorthwest: %s,\nnorthEast: %s,\nsouthWest: %s,\nsouthEast: %s,\npoints: %s,\nbbox: %s,\nmaxPoints: %s,\nmaxDepth: %s,\nparent: %s"
             % (
                 self.northWest,
                 self.northEast,
@@ -110,17 +155,162 @@ class PointQuadTree(object):
                 self.points,
                 self.bbox,
                 self.maxPoints,
+                self.maxDepth,
                 self.parent,
             )
         )
 
     def reset(self, points):
-        self.init()
+        pts = []
         for point in points:
             if isinstance(point, Point):
-                self.insert(point)
+                pts.append(point)
+            else:
+                pts.append(Point(point.x, point.y, data=point.data))
+        xs = np.fromiter((p.x for p in pts), dtype=np.float64, count=len(pts))
+        ys = np.fromiter((p.y for p in pts), dtype=np.float64, count=len(pts))
+        self._bulkLoadPoints(pts, xs, ys)
+
+    @classmethod
+    def fromArrays(cls, bbox, xs, ys, ids=None, maxPoints=1, maxDepth=MAX_DEPTH):
+        """Build a tree from coordinate arrays with a Morton order bulk load.
+        Params:
+            bbox (Rectangle) : bounds of the tree
+            xs (array) : x coordinates
+            ys (array) : y coordinates
+            ids (array) : id stored in each point's data, defaults to the array index
+            maxPoints (int) : leaf capacity
+            maxDepth (int) : deepest level, leaves there hold any number of points
+        Returns:
+            PointQuadTree
+        """
+        tree = cls(bbox, maxPoints, maxDepth=maxDepth)
+        tree.bulkLoad(xs, ys, ids)
+        return tree
+
+    def bulkLoad(self, xs, ys, ids=None):
+        """
+        Clear the tree and load coordinate arrays in one pass. Each point becomes a
+        Point with data={"id": id}.
+        Params:
+            xs (array) : x coordinates
+            ys (array) : y coordinates
+            ids (array) : id per point, defaults to the array index
+        Returns:
+            int : number of points loaded
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if ids is None:
+            ids = range(len(xs))
+        elif isinstance(ids, np.ndarray):
+            ids = ids.tolist()
+        pts = [
+            Point(x, y, data={"id": i})
+            for x, y, i in zip(xs.tolist(), ys.tolist(), ids)
+        ]
+        return self._bulkLoadPoints(pts, xs, ys)
+
+    def _bulkLoadPoints(self, points, xs, ys):
+        """
+        Rebuild this tree from `points` (with coordinate arrays xs, ys) bottom up:
+        the points are sorted by Morton key, the node layout is cut out of the sorted
+        order (see morton.buildLinear) and then the nodes are created and linked.
+        Points only end up in leaves. Points outside the bbox are skipped.
+        Leaves at maxDepth and leaves of coincident points are left overfull.
+        """
+        self.init()
+
+        inside = (
+            (xs >= self.bbox.left)
+            & (xs <= self.bbox.right)
+            & (ys >= self.bbox.top)
+            & (ys <= self.bbox.bottom)
+        )
+        if not inside.all():
+            keep = np.flatnonzero(inside).tolist()
+            points = [points[i] for i in keep]
+            xs = xs[inside]
+            ys = ys[inside]
+
+        order, bounds, children, depth, start, count = buildLinear(
+            xs,
+            ys,
+            (self.bbox.left, self.bbox.top, self.bbox.right, self.bbox.bottom),
+            self.maxPoints,
+            self.maxDepth - self.parent,
+        )
+        order = order.tolist()
+        children = children.tolist()
+        start = start.tolist()
+        count = count.tolist()
+
+        nodes = [self]
+        for (l, t, r, b), d in zip(bounds[1:].tolist(), depth[1:].tolist()):
+            nodes.append(
+                PointQuadTree(
+                    Rectangle(p1=Point(l, t), p2=Point(r, b)),
+                    self.maxPoints,
+                    self.parent + d,
+                    self.maxDepth,
+                )
+            )
+
+        for i, node in enumerate(nodes):
+            ne, se, sw, nw = children[i]
+            if ne >= 0:
+                node.northEast = nodes[ne]
+                node.southEast = nodes[se]
+                node.southWest = nodes[sw]
+                node.northWest = nodes[nw]
             else:
-                self.insert(Point(point.x, point.y, data=point.data))
+                node.points = [points[j] for j in order[start[i] : start[i] + count[i]]]
+
+        self._bulkAggregates(
+            nodes, xs, ys, np.array(order, dtype=np.int64), children, start, count
+        )
+        return len(points)
+
+    def _bulkAggregates(self, nodes, xs, ys, order, children, start, count):
+        """
+        Fill in the aggregates of freshly bulk loaded nodes: leaves from their run of
+        the sorted coordinates, then internal nodes from their children, deepest first
+        (children always come after their parent in `nodes`).
+        """
+        sx = xs[order]
+        sy = ys[order]
+
+        # the non empty leaves' runs tile the sorted coordinates, so one reduceat per
+        # aggregate over their starts (in run order) covers every leaf at once
+        leaves = [i for i, c in enumerate(count) if c and children[i][0] < 0]
+        leaves.sort(key=start.__getitem__)
+        starts = np.array([start[i] for i in leaves], dtype=np.int64)
+        if len(leaves):
+            sumX = np.add.reduceat(sx, starts).tolist()
+            sumY = np.add.reduceat(sy, starts).tolist()
+            minX = np.minimum.reduceat(sx, starts).tolist()
+            maxX = np.maximum.reduceat(sx, starts).tolist()
+            minY = np.minimum.reduceat(sy, starts).tolist()
+            maxY = np.maximum.reduceat(sy, starts).tolist()
+            for k, i in enumerate(leaves):
+                node = nodes[i]
+                node.count = count[i]
+                node.sumX = sumX[k]
+                node.sumY = sumY[k]
+                node.minX = minX[k]
+                node.maxX = maxX[k]
+                node.minY = minY[k]
+                node.maxY = maxY[k]
+
+        for i in range(len(nodes) - 1, -1, -1):
+            if children[i][0] < 0:
+                continue
+            node = nodes[i]
+            for child in node._children():
+                node.count += child.count
+                node.sumX += child.sumX
+                node.sumY += child.sumY
+            node._recomputeExtent()
 
     def insert(self, point):
         """
@@ -130,10 +320,14 @@ class PointQuadTree(object):
             # print "Point %s is not inside bounding box %s" % (point,self.bbox)
             return False
 
-        if len(self.points) < self.maxPoints:
+        # The point ends up somewhere under this node
+        self._addAggregate(point.x, point.y)
+
+        if len(self.points) < self.maxPoints or self._keepsOverflow(point):
             # If we still have spaces in the bucket array for this QuadTree node,
             #    then the point simply goes here and we're finished
             self.points.append(point)
+            self.localVersion += 1
             return True
         elif self.northEast == None:
             # Otherwise we split this node into NW/NE/SE/SW quadrants
@@ -151,6 +345,231 @@ class PointQuadTree(object):
         # If we couldn't insert the new point, then we have an exception situation
         raise ValueError("Point %s is outside bounding box %s" % (point, self.bbox))
 
+    def _keepsOverflow(self, point):
+        """
+        True if this full leaf should take the point anyway instead of splitting: it is
+        at maxDepth, or the point sits exactly where all its points already are (no
+        split could ever separate them).
+        """
+        if not self.northEast == None:
+            return False
+        if self.parent >= self.maxDepth:
+            return True
+        x = point.x
+        y = point.y
+        for p in self.points:
+            if p.x != x or p.y != y:
+                return False
+        return True
+
+    def remove(self, point):
+        """
+        Remove a point (the same object that was inserted) from this QuadTree node.
+        Quadrants that end up with maxPoints or fewer points between them are merged
+        back into their parent.
+        Params:
+            point (Point)
+        Returns:
+            bool : False if the point wasn't in the tree
+        """
+        return self._remove(point, point.x, point.y)
+
+    def update(self, point, oldX, oldY):
+        """
+        A point in the tree moved from (oldX, oldY) to (point.x, point.y). The point only
+        leaves its node when it crossed the node's border, and then it is pushed up just
+        far enough to find a node that holds the new position. A point that wasn't in the
+        tree yet is inserted.
+        Params:
+            point (Point)
+            oldX (float) : x before the move
+            oldY (float) : y before the move
+        Returns:
+            bool : False if the point has left the tree's bbox (it is removed)
+        """
+        result = self._relocate(point, oldX, oldY)
+        if result == NOT_FOUND:
+            return self.insert(point)
+        return result == SETTLED
+
+    def _containsXY(self, x, y):
+        return (
+            self.bbox.left <= x <= self.bbox.right
+            and self.bbox.top <= y <= self.bbox.bottom
+        )
+
+    def _children(self):
+        return (self.northEast, self.southEast, self.southWest, self.northWest)
+
+    def _remove(self, point, x, y):
+        """Remove `point` which is stored at (x, y)."""
+        if not self._containsXY(x, y):
+            return False
+
+        for i, p in enumerate(self.points):
+            if p is point:
+                del self.points[i]
+                self.localVersion += 1
+                self._dropAggregate(x, y)
+                self._merge()
+                return True
+
+        if self.northEast == None:
+            return False
+
+        for child in self._children():
+            if child._remove(point, x, y):
+                self._dropAggregate(x, y)
+                self._merge()
+                return True
+        return False
+
+    def _relocate(self, point, oldX, oldY):
+        """
+        Find `point` under its old position and settle it for its new one.
+        Returns:
+            NOT_FOUND : point isn't under this node
+            SETTLED   : point is in a node that holds its new position
+            MOVED     : point was taken out and still needs a home
+        """
+        if not self._containsXY(oldX, oldY):
+            return NOT_FOUND
+
+        for i, p in enumerate(self.points):
+            if p is point:
+                self.localVersion += 1
+                if self.bbox.contains(point):
+                    self._shiftAggregate(oldX, oldY, point.x, point.y)
+                    return SETTLED
+                del self.points[i]
+                self._dropAggregate(oldX, oldY)
+                self._merge()
+                return MOVED
+
+        if self.northEast == None:
+            return NOT_FOUND
+
+        for child in self._children():
+            result = child._relocate(point, oldX, oldY)
+            if result == NOT_FOUND:
+                continue
+            if result == SETTLED:
+                self._shiftAggregate(oldX, oldY, point.x, point.y)
+                return SETTLED
+            self._dropAggregate(oldX, oldY)
+            self._merge()
+            if self.bbox.contains(point):
+                self.insert(point)
+                return SETTLED
+            return MOVED
+        return NOT_FOUND
+
+    def _addAggregate(self, x, y):
+        self.version += 1
+        self.count += 1
+        self.sumX += x
+        self.sumY += y
+        if x < self.minX:
+            self.minX = x
+        if x > self.maxX:
+            self.maxX = x
+        if y < self.minY:
+            self.minY = y
+        if y > self.maxY:
+            self.maxY = y
+
+    def _dropAggregate(self, x, y):
+        """Take a point at (x, y) out of the aggregates. Children are already updated."""
+        self.version += 1
+        self.count -= 1
+        self.sumX -= x
+        self.sumY -= y
+        if x == self.minX or x == self.maxX or y == self.minY or y == self.maxY:
+            self._recomputeExtent()
+
+    def _shiftAggregate(self, oldX, oldY, x, y):
+        """A point under this node moved from (oldX, oldY) to (x, y)."""
+        self.version += 1
+        self.sumX += x - oldX
+        self.sumY += y - oldY
+        if (
+            oldX == self.minX
+            or oldX == self.maxX
+            or oldY == self.minY
+            or oldY == self.maxY
+        ):
+            self._recomputeExtent()
+        else:
+            self.minX = min(self.minX, x)
+            self.maxX = max(self.maxX, x)
+            self.minY = min(self.minY, y)
+            self.maxY = max(self.maxY, y)
+
+    def _recomputeExtent(self):
+        """Tight extent from this node's own points and its children's extents."""
+        self.minX = math.inf
+        self.minY = math.inf
+        self.maxX = -math.inf
+        self.maxY = -math.inf
+        for p in self.points:
+            self.minX = min(self.minX, p.x)
+            self.maxX = max(self.maxX, p.x)
+            self.minY = min(self.minY, p.y)
+            self.maxY = max(self.maxY, p.y)
+        if not self.northEast == None:
+            for child in self._children():
+                if child.count:
+                    self.minX = min(self.minX, child.minX)
+                    self.maxX = max(self.maxX, child.maxX)
+                    self.minY = min(self.minY, child.minY)
+                    self.maxY = max(self.maxY, child.maxY)
+
+    def extent(self):
+        """Tight bounding Rectangle of the points under this node.
+        Params:
+            None
+        Returns:
+            Rectangle : or None for an empty node
+        """
+        if not self.count:
+            return None
+        return Rectangle(p1=Point(self.minX, self.minY), p2=Point(self.maxX, self.maxY))
+
+    def centroid(self):
+        """Mean position of the points under this node.
+        Params:
+            None
+        Returns:
+            Point : or None for an empty node
+        """
+        if not self.count:
+            return None
+        return Point(self.sumX / self.count, self.sumY / self.count)
+
+    def _merge(self):
+        """
+        Fold the four quadrants back into this node when they are all leaves and
+        there are no more than maxPoints points here and in them combined.
+        """
+        if self.northEast == None:
+            return
+        total = len(self.points)
+        for child in self._children():
+            if not child.northEast == None:
+                return
+            total += len(child.points)
+        if total > self.maxPoints:
+            return
+
+        for child in self._children():
+            self.points.extend(child.points)
+        self.version += 1
+        self.localVersion += 1
+        self.northEast = None
+        self.southEast = None
+        self.southWest = None
+        self.northWest = None
+
     def subdivide(self):
         """
         Split this QuadTree node into four quadrants for NW/NE/SE/SW
@@ -161,83 +580,507 @@ class PointQuadTree(object):
         b = self.bbox.bottom
         mX = (l + r) / 2
         mY = (t + b) / 2
-        self.northEast = PointQuadTree(
-            Rectangle(p1=Point(mX, t), p2=Point(r, mY)), self.maxPoints, self.parent + 1
-        )
-        self.southEast = PointQuadTree(
-            Rectangle(p1=Point(mX, mY), p2=Point(r, b)), self.maxPoints, self.parent + 1
-        )
-        self.southWest = PointQuadTree(
-            Rectangle(p1=Point(l, mY), p2=Point(mX, b)), self.maxPoints, self.parent + 1
-        )
-        self.northWest = PointQuadTree(
-            Rectangle(p1=Point(l, t), p2=Point(mX, mY)), self.maxPoints, self.parent + 1
-        )
+        self.version += 1
+        self.localVersion += 1
+        self.northEast = self._child(Rectangle(p1=Point(mX, t), p2=Point(r, mY)))
+        self.southEast = self._child(Rectangle(p1=Point(mX, mY), p2=Point(r, b)))
+        self.southWest = self._child(Rectangle(p1=Point(l, mY), p2=Point(mX, b)))
+        self.northWest = self._child(Rectangle(p1=Point(l, t), p2=Point(mX, mY)))
+
+    def _child(self, bbox):
+        return PointQuadTree(bbox, self.maxPoints, self.parent + 1, self.maxDepth)
+
+    def iterNodes(self, predicate=None):
+        """
+        Walk this QuadTree depth first (NW, NE, SW, SE) with an explicit stack, so deep
+        trees never touch the recursion limit. Nodes are yielded lazily.
+
+        predicate(node) decides what happens to each node:
+            SKIP   -- leave out the node and everything under it
+            VISIT  -- yield the node and look at its children
+            ACCEPT -- the node and everything under it match, they are all yielded
+                      without calling predicate again
+        No predicate visits every node.
+        Params:
+            predicate (callable) : node -> SKIP / VISIT / ACCEPT
+        Returns:
+            generator : (node, accepted) tuples, accepted is True under an ACCEPT
+        """
+        stack = [(self, False)]
+        while stack:
+            node, accepted = stack.pop()
+            if not accepted and predicate is not None:
+                verdict = predicate(node)
+                if verdict == SKIP:
+                    continue
+                accepted = verdict == ACCEPT
+
+            yield node, accepted
+
+            if not node.northWest == None:
+                stack.append((node.southEast, accepted))
+                stack.append((node.southWest, accepted))
+                stack.append((node.northEast, accepted))
+                stack.append((node.northWest, accepted))
+
+    def iterPoints(self):
+        """Yield every point in this QuadTree."""
+        for node, _ in self.iterNodes():
+            yield from node.points
+
+    def iterSearchBox(self, bbox):
+        """Lazily yield the points that fall within the specified bounding box.
+
+        Quadrants that don't touch the query are skipped and quadrants the query
+        encompasses are yielded whole, without testing their points.
+        """
+
+        def predicate(node):
+            # the tight extent of the points decides, edges count (like contains)
+            if not node.count or not _extentTouches(node, bbox):
+                return SKIP
+            if _extentInside(node, bbox):
+                return ACCEPT
+            return VISIT
+
+        for node, accepted in self.iterNodes(predicate):
+            if accepted:
+                yield from node.points
+            else:
+                for p in node.points:
+                    if bbox.contains(p):
+                        yield p
 
     def searchBox(self, bbox):
         """Return an array of all points within this QuadTree and its child nodes that fall
         within the specified bounding box
         """
-        results = []
+        region = (bbox.left, bbox.top, bbox.right, bbox.bottom)
+        return list(
+            self._cached(("box",) + region, region, lambda: self.iterSearchBox(bbox))
+        )
+
+    def countBox(self, bbox):
+        """Count the points within the specified bounding box without listing them.
 
-        if self.bbox.overlaps(bbox) or self.bbox.encompasses(bbox):
-            # Test each point that falls within the current QuadTree node
-            for p in self.points:
-                # Test each point stored in this QuadTree node in turn, adding to the results array
-                #    if it falls within the bounding box
-                if self.bbox.contains(p):
-                    results.append((bbox, self.parent))
+        Nodes whose points all fall inside the box (by their tight extent) add their
+        count in one go, so only nodes the box's border cuts through are looked into.
+        Params:
+            bbox (Rectangle)
+        Returns:
+            int : number of points
+        """
+        region = (bbox.left, bbox.top, bbox.right, bbox.bottom)
+        return self._cached(("count",) + region, region, lambda: self._countBox(bbox))
 
-            # If we have child QuadTree nodes....
-            if not self.northWest == None:
-                # ... search each child node in turn, merging with any existing results
-                results = results + self.northWest.searchBox(self.bbox)
-                results = results + self.northEast.searchBox(self.bbox)
-                results = results + self.southWest.searchBox(self.bbox)
-                results = results + self.southEast.searchBox(self.bbox)
+    def _countBox(self, bbox):
+        total = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node.count or not _extentTouches(node, bbox):
+                continue
+            if _extentInside(node, bbox):
+                total += node.count
+                continue
 
-        return results
+            for p in node.points:
+                if bbox.contains(p):
+                    total += 1
+            if not node.northWest == None:
+                stack.extend(node._children())
+        return total
 
-    def searchNeighbors(self, point):
-        """Returns the containers points that are in the same container as another point."""
+    def iterSearchNeighbors(self, point):
+        """Lazily yield the points stored in the nodes whose quadrant holds a point."""
         # If its not a point (its a bounding rectangle)
         if not hasattr(point, "x"):
+            return
+
+        def predicate(node):
+            return VISIT if node.bbox.contains(point) else SKIP
+
+        for node, _ in self.iterNodes(predicate):
+            yield from node.points
+
+    def searchNeighbors(self, point):
+        """Returns the containers points that are in the same container as another point."""
+        return list(self.iterSearchNeighbors(point))
+
+    def iterSearchRadius(self, center, r):
+        """Lazily yield the points within distance r of a center point.
+
+        Quadrants the circle doesn't reach are skipped, quadrants the circle covers
+        completely are yielded whole, and only the points of nodes straddling the circle
+        are checked (with squared distances).
+        """
+        x = center.x
+        y = center.y
+        rSq = r * r
+
+        def predicate(node):
+            if _boxDistanceSq(node.bbox, x, y) > rSq:
+                return SKIP
+            if _boxFarthestSq(node.bbox, x, y) <= rSq:
+                return ACCEPT
+            return VISIT
+
+        for node, accepted in self.iterNodes(predicate):
+            if accepted:
+                yield from node.points
+            else:
+                for p in node.points:
+                    dx = p.x - x
+                    dy = p.y - y
+                    if dx * dx + dy * dy <= rSq:
+                        yield p
+
+    def searchRadius(self, center, r):
+        """Return all points within distance r of a center point.
+        Params:
+            center (Point) : anything with x and y (a Ball works)
+            r (float) : radius
+        Returns:
+            list : matching points
+        """
+        x = center.x
+        y = center.y
+        return list(
+            self._cached(
+                ("radius", x, y, r),
+                (x - r, y - r, x + r, y + r),
+                lambda: self.iterSearchRadius(center, r),
+            )
+        )
+
+    def iterSearchPolygon(self, polygon):
+        """Lazily yield the points inside a polygon.
+
+        Quadrants outside the polygon's mbr are skipped straight away. The rest are
+        classified against the polygon's border: quadrants completely outside are
+        skipped, quadrants completely inside are yielded whole, and point-in-polygon
+        tests only run in quadrants the border passes through. Each quadrant hands the
+        edges crossing it down to its children, so classification gets cheaper deeper
+        down the tree.
+        """
+        mbr = polygon.mbr
+        stack = [(self, polygon.edges())]
+        while stack:
+            node, edges = stack.pop()
+            if not node.bbox.touches(mbr):
+                continue
+
+            relation, edges = polygon.classifyRectangle(node.bbox, edges)
+            if relation == OUTSIDE:
+                continue
+            if relation == INSIDE:
+                yield from node.iterPoints()
+                continue
+
+            for p in node.points:
+                if polygon.pointInsidePolygon(p):
+                    yield p
+
+            if not node.northWest == None:
+                for child in node._children():
+                    stack.append((child, edges))
+
+    def searchPolygon(self, polygon):
+        """Return all points inside a polygon.
+        Params:
+            polygon (Polygon)
+        Returns:
+            list : matching points
+        """
+        return list(self.iterSearchPolygon(polygon))
+
+    def iterNearest(self, point, maxDistance=None):
+        """Lazily yield points closest first, as (point, distance) tuples.
+
+        Nodes and points share one priority queue ordered by (squared) distance; a node
+        goes in keyed by the distance from the point to its bbox, which no point inside
+        it can beat. So whole quadrants are only opened once they are closer than
+        everything already yielded, and nothing beyond what the caller consumes is
+        opened at all.
+        Params:
+            point (Point) : anything with x and y
+            maxDistance (float) : stop once points are further away than this
+        Returns:
+            generator : (point, distance) tuples, closest first
+        """
+        x = point.x
+        y = point.y
+        limit = None if maxDistance is None else maxDistance * maxDistance
+
+        # entries are (distance squared, tie breaker, node, point)
+        tie = 0
+        queue = [(_boxDistanceSq(self.bbox, x, y), tie, self, None)]
+
+        while queue:
+            d, _, node, p = heapq.heappop(queue)
+            if limit is not None and d > limit:
+                return
+
+            if node == None:
+                yield p, math.sqrt(d)
+                continue
+
+            for p in node.points:
+                dx = p.x - x
+                dy = p.y - y
+                tie += 1
+                heapq.heappush(queue, (dx * dx + dy * dy, tie, None, p))
+
+            if not node.northWest == None:
+                for child in node._children():
+                    tie += 1
+                    heapq.heappush(
+                        queue, (_boxDistanceSq(child.bbox, x, y), tie, child, None)
+                    )
+
+    def nearest(self, point, k=1, maxDistance=None):
+        """Find the k points closest to a point.
+        Params:
+            point (Point) : anything with x and y
+            k (int) : number of points wanted
+            maxDistance (float) : ignore points further away than this
+        Returns:
+            list : up to k (point, distance) tuples, closest first
+        """
+        if k <= 0:
             return []
+        return list(itertools.islice(self.iterNearest(point, maxDistance), k))
 
-        results = []
+    def enableCache(self, maxEntries=CACHE_SIZE):
+        """
+        Keep the results of searchBox, countBox and searchRadius, so repeating a query
+        on an unchanged part of the tree costs a check of a few version counters
+        instead of a search. The least recently used results are dropped once there
+        are more than maxEntries. Points moved without calling update() aren't noticed.
+        Params:
+            maxEntries (int) : most results kept
+        Returns:
+            None
+        """
+        self.cache = QueryCache(maxEntries)
+
+    def disableCache(self):
+        """Stop caching query results and drop the ones kept so far."""
+        self.cache = None
 
-        if self.bbox.containsPoint(point):
-            # Test each point that falls within the current QuadTree node
-            for p in self.points:
-                # Test each point stored in this QuadTree node in turn, adding to the results array
-                #    if it falls within the bounding box
-                if self.bbox.containsPoint(p):
-                    results.append(p)
+    def cacheStats(self):
+        """Hit / miss / eviction / invalidation counts and size of the query cache.
+        Params:
+            None
+        Returns:
+            dict : or None if the cache is off
+        """
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    def _cached(self, key, region, compute):
+        """
+        Answer a query from the cache, or by calling compute() and keeping the result
+        together with the nodes `region` (left, top, right, bottom) depends on.
+        """
+        if self.cache is None:
+            return compute()
+        result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            if not isinstance(result, int):
+                result = tuple(result)
+            self.cache.put(key, self._dependencies(*region), result)
+        return result
 
-            # If we have child QuadTree nodes....
-            if not self.northWest == None:
-                # ... search each child node in turn, merging with any existing results
-                results = results + self.northWest.searchNeighbors(point)
-                results = results + self.northEast.searchNeighbors(point)
-                results = results + self.southWest.searchNeighbors(point)
-                results = results + self.southEast.searchNeighbors(point)
+    def _dependencies(self, left, top, right, bottom):
+        """
+        The nodes whose changes could alter the answer to a query over a region, as
+        (node, whole, version) tuples. Nodes the region covers, and leaves it touches,
+        depend on everything under them (version). Inner nodes it only cuts through
+        depend on their own points and quadrants (localVersion), their quadrants are
+        checked themselves.
+        """
+        dependencies = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            b = node.bbox
+            if b.left > right or b.right < left or b.top > bottom or b.bottom < top:
+                continue
+            if node.northEast == None or (
+                left <= b.left
+                and b.right <= right
+                and top <= b.top
+                and b.bottom <= bottom
+            ):
+                dependencies.append((node, True, node.version))
+            else:
+                dependencies.append((node, False, node.localVersion))
+                stack.extend(node._children())
+        return dependencies
 
-        return results
+    def iterBBoxes(self):
+        """Lazily yield the draw info of every node."""
+        for node, _ in self.iterNodes():
+            yield {"bbox": node.bbox, "color": node.color, "parent": node.parent}
 
     def getBBoxes(self):
         """Print helper to draw tree"""
-        bboxes = []
+        return list(self.iterBBoxes())
+
 
-        bboxes.append({"bbox": self.bbox, "color": self.color, "parent": self.parent})
+class QueryCache(object):
+    """
+    class QueryCache:
+
+        Bounded LRU table of query results for a PointQuadTree (see enableCache).
+
+    Every result is kept with the nodes it depends on and the version each of them had
+    at the time. A lookup compares those versions with the nodes' current ones: a
+    change anywhere else in the tree leaves the result valid, a change under one of its
+    nodes drops it. Entries are kept in an OrderedDict from least to most recently used.
+
+    @method: get   -- a still valid result, or None
+    @method: put   -- keep a result, evicting the least recently used ones
+    @method: clear -- drop every result
+    @method: stats -- hit / miss / eviction / invalidation counts
+    """
+
+    def __init__(self, maxEntries=CACHE_SIZE):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the result kept under key if none of its nodes changed since, else
+        None (a changed one is dropped)."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        dependencies, result = entry
+        for node, whole, version in dependencies:
+            if (node.version if whole else node.localVersion) != version:
+                del self.entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, dependencies, result):
+        """Keep a result with its (node, whole, version) dependencies."""
+        self.entries[key] = (dependencies, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self.entries),
+            "maxEntries": self.maxEntries,
+        }
+
+
+def _extentTouches(node, bbox):
+    """True if a node's tight extent touches a rectangle."""
+    return (
+        node.minX <= bbox.right
+        and node.maxX >= bbox.left
+        and node.minY <= bbox.bottom
+        and node.maxY >= bbox.top
+    )
+
+
+def _extentInside(node, bbox):
+    """True if a node's tight extent is inside a rectangle (so all its points are)."""
+    return (
+        bbox.left <= node.minX
+        and node.maxX <= bbox.right
+        and bbox.top <= node.minY
+        and node.maxY <= bbox.bottom
+    )
+
+
+def _boxDistanceSq(bbox, x, y):
+    """Squared distance from (x, y) to the closest point of a rectangle (0 inside it)."""
+    dx = max(bbox.left - x, 0, x - bbox.right)
+    dy = max(bbox.top - y, 0, y - bbox.bottom)
+    return dx * dx + dy * dy
+
+
+def _boxFarthestSq(bbox, x, y):
+    """Squared distance from (x, y) to the furthest corner of a rectangle."""
+    dx = max(x - bbox.left, bbox.right - x)
+    dy = max(y - bbox.top, bbox.bottom - y)
+    return dx * dx + dy * dy
+
+
+def autotuneMaxPoints(
+    bbox,
+    points,
+    queries=None,
+    candidates=(1, 2, 4, 8, 16, 32, 64),
+    sample=10000,
+    maxDepth=MAX_DEPTH,
+):
+    """Pick the leaf capacity that runs a sample of a workload fastest.
+
+    For every candidate a tree is filled with a random sample of the points (one insert
+    at a time, like TreeDriver does) and then every query box is searched. The total time
+    of both decides.
+    Params:
+        bbox (Rectangle) : bounds of the tree
+        points (list) : Points (or anything with x, y and data) of the workload
+        queries (list) : Rectangles to search, defaults to 500 boxes 2% of the bbox wide
+                         around sampled points
+        candidates (tuple) : maxPoints values to try
+        sample (int) : how many points to insert per candidate
+        maxDepth (int) : passed on to the trees
+    Returns:
+        tuple : (best maxPoints, {maxPoints: seconds})
+    """
+    points = [p for p in points if bbox.contains(p)]
+    if len(points) > sample:
+        points = random.sample(points, sample)
+    if queries is None:
+        halfW = bbox.w * 0.01
+        halfH = bbox.h * 0.01
+        queries = [
+            Rectangle(
+                p1=Point(p.x - halfW, p.y - halfH), p2=Point(p.x + halfW, p.y + halfH)
+            )
+            for p in random.sample(points, min(500, len(points)))
+        ]
 
-        if not self.northWest == None:
-            # ... search each child node in turn, merging with any existing results
-            bboxes = bboxes + self.northWest.getBBoxes()
-            bboxes = bboxes + self.northEast.getBBoxes()
-            bboxes = bboxes + self.southWest.getBBoxes()
-            bboxes = bboxes + self.southEast.getBBoxes()
+    timings = {}
+    for maxPoints in candidates:
+        began = time.perf_counter()
+        tree = PointQuadTree(bbox, maxPoints, maxDepth=maxDepth)
+        for p in points:
+            tree.insert(p)
+        for q in queries:
+            tree.searchBox(q)
+        timings[maxPoints] = time.perf_counter() - began
 
-        return bboxes
+    return min(timings, key=timings.get), timings
 
 
 if __name__ == "__main__":
@@ -1,15 +1,22 @@
 import sys
 import math
 import random
+import numpy as np
 from point import Point
 from rectangle import Rectangle
 
+# where a rectangle sits relative to a polygon, see Polygon.classifyRectangle
+OUTSIDE = 0
+INSIDE = 1
+STRADDLES = 2
+
 
 class Polygon(object):
     def __init__(self, *args, **kwargs):
         """Initialize a polygon from list of points."""
         self.points = []
         self.mbr = None
+        self.slabs = None
 
         # get list of points passed in ...
         if len(args) == 1:
@@ -35,6 +42,8 @@ class Polygon(object):
         self.maxY = pow(2, 30) * -1
 
         self.points = []
+        # a new outline invalidates any prepared edge index
+        self.slabs = None
 
         for p in pts:
             x = p.x
@@ -73,6 +82,9 @@ class Polygon(object):
         Returns:
             bool : True = point in polygon
         """
+        if self.slabs is not None:
+            return self._pointInsidePrepared(p.x, p.y)
+
         n = len(self.points)
         inside = False
 
@@ -90,6 +102,174 @@ class Polygon(object):
 
         return inside
 
+    def prepare(self, numSlabs=None):
+        """Build an edge index so point tests only look at nearby edges.
+
+           The mbr is cut into horizontal slabs of equal height and every slab keeps
+           the (non horizontal) edges whose y range reaches into it. A horizontal ray
+           from a point can only cross edges spanning the point's y, which all sit in
+           the point's slab, so a test touches one slab's edges instead of all of them.
+           Preparing is worth it for polygons with many vertices that get tested a lot;
+           pointInsidePolygon and containsPoints use the index once it exists.
+        Params:
+            numSlabs (int) : number of slabs, defaults to one per edge
+        Returns:
+            self (Polygon)
+        """
+        x1, y1, x2, y2 = self._edgeArrays()
+        if numSlabs is None:
+            numSlabs = max(1, len(x1))
+        height = (self.maxY - self.minY) / numSlabs
+
+        # slab range each edge covers
+        first = self._slabOf(np.minimum(y1, y2), numSlabs, height)
+        last = self._slabOf(np.maximum(y1, y2), numSlabs, height)
+        spans = last - first + 1
+        edge = np.repeat(np.arange(len(x1)), spans)
+        slab = np.repeat(first - np.cumsum(spans) + spans, spans) + np.arange(
+            spans.sum()
+        )
+
+        order = np.argsort(slab, kind="stable")
+        offsets = np.zeros(numSlabs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(slab, minlength=numSlabs), out=offsets[1:])
+
+        self.slabs = {
+            "count": numSlabs,
+            "height": height,
+            "offsets": offsets,
+            "edges": edge[order],
+            "x1": x1,
+            "y1": y1,
+            "x2": x2,
+            "y2": y2,
+        }
+        # plain lists of edge tuples per slab for the one point at a time test
+        edges = list(zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()))
+        members = self.slabs["edges"].tolist()
+        self.slabs["lists"] = [
+            [edges[e] for e in members[offsets[i] : offsets[i + 1]]]
+            for i in range(numSlabs)
+        ]
+        return self
+
+    def containsPoints(self, xs, ys):
+        """Point in polygon test for whole arrays of points at once (same rule as
+           pointInsidePolygon). Uses the slab index when the polygon is prepared.
+        Params:
+            xs (array) : x coordinates
+            ys (array) : y coordinates
+        Returns:
+            ndarray(bool) : True = point in polygon
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        inside = np.zeros(len(xs), dtype=bool)
+
+        # no edge can be crossed outside of these
+        candidates = np.flatnonzero(
+            (ys > self.minY) & (ys <= self.maxY) & (xs <= self.maxX)
+        )
+        if not candidates.size:
+            return inside
+
+        if self.slabs is None:
+            x1, y1, x2, y2 = self._edgeArrays()
+            inside[candidates] = _crossings(
+                xs[candidates], ys[candidates], x1, y1, x2, y2
+            )
+            return inside
+
+        slabs = self.slabs
+        slab = self._slabOf(ys[candidates], slabs["count"], slabs["height"])
+        order = np.argsort(slab, kind="stable")
+        candidates = candidates[order]
+        slab = slab[order]
+
+        # one vectorized pass per occupied slab, against that slab's edges only
+        used, starts = np.unique(slab, return_index=True)
+        ends = np.append(starts[1:], len(slab))
+        for s, lo, hi in zip(used.tolist(), starts.tolist(), ends.tolist()):
+            edges = slabs["edges"][slabs["offsets"][s] : slabs["offsets"][s + 1]]
+            if not edges.size:
+                continue
+            points = candidates[lo:hi]
+            inside[points] = _crossings(
+                xs[points],
+                ys[points],
+                slabs["x1"][edges],
+                slabs["y1"][edges],
+                slabs["x2"][edges],
+                slabs["y2"][edges],
+            )
+        return inside
+
+    def _pointInsidePrepared(self, x, y):
+        """pointInsidePolygon using only the edges of the point's slab."""
+        if not self.minY < y <= self.maxY or x > self.maxX:
+            return False
+        slabs = self.slabs
+        s = min(int((y - self.minY) / slabs["height"]), slabs["count"] - 1)
+        inside = False
+        for x1, y1, x2, y2 in slabs["lists"][s]:
+            if min(y1, y2) < y <= max(y1, y2):
+                if x <= (y - y1) * (x2 - x1) / (y2 - y1) + x1:
+                    inside = not inside
+        return inside
+
+    def _edgeArrays(self):
+        """Edge endpoints as arrays, leaving out horizontal edges (they never count)."""
+        edges = np.array(self.edges(), dtype=np.float64).reshape(-1, 4)
+        edges = edges[edges[:, 1] != edges[:, 3]]
+        return edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+
+    def _slabOf(self, ys, numSlabs, height):
+        if height <= 0:
+            return np.zeros(len(ys), dtype=np.int64)
+        slab = np.floor((ys - self.minY) / height).astype(np.int64)
+        return np.clip(slab, 0, numSlabs - 1)
+
+    def edges(self):
+        """Get the polygon's edges, including the closing one.
+        Params:
+            None
+        Returns:
+            edges (List[tuples]) : (x1, y1, x2, y2) per edge
+        """
+        n = len(self.points)
+        generic = []
+        for i in range(n):
+            p1 = self.points[i]
+            p2 = self.points[(i + 1) % n]
+            generic.append((p1.x, p1.y, p2.x, p2.y))
+        return generic
+
+    def classifyRectangle(self, rect, edges=None):
+        """Work out whether a rectangle is completely inside, completely outside or
+           straddling the polygon's border.
+
+           If no edge passes through the rectangle the whole rectangle is on one side of
+           the border, and one point-in-polygon test on it decides which. The edges that
+           do pass through are returned so a caller splitting the rectangle up (like a
+           quadtree) only needs to look at those for the pieces.
+        Params:
+            rect (Rectangle)
+            edges (List[tuples]) : edges to consider, defaults to all of them
+        Returns:
+            tuple : (OUTSIDE / INSIDE / STRADDLES, edges touching the rectangle)
+        """
+        if edges is None:
+            edges = self.edges()
+
+        l, t, r, b = rect.left, rect.top, rect.right, rect.bottom
+        crossing = [e for e in edges if _segmentTouchesBox(e, l, t, r, b)]
+        if crossing:
+            return STRADDLES, crossing
+
+        if self.pointInsidePolygon(Point((l + r) / 2, (t + b) / 2)):
+            return INSIDE, crossing
+        return OUTSIDE, crossing
+
     def orderPoints(self):
         """ """
         assert not self.centroid == None
@@ -150,6 +330,47 @@ class Polygon(object):
         return "%s %s" % (self.__class__.__name__, "".join(str(self.points)))
 
 
+def _crossings(px, py, x1, y1, x2, y2, chunk=4096):
+    """
+    Crossing number test of points against edges (no horizontal edges), done as a
+    points x edges matrix a chunk of points at a time. True = odd number of crossings.
+    """
+    result = np.zeros(len(px), dtype=bool)
+    low = np.minimum(y1, y2)
+    high = np.maximum(y1, y2)
+    dx = x2 - x1
+    dy = y2 - y1
+    for start in range(0, len(px), chunk):
+        x = px[start : start + chunk, None]
+        y = py[start : start + chunk, None]
+        crosses = (low < y) & (y <= high) & (x <= (y - y1) * dx / dy + x1)
+        result[start : start + chunk] = np.count_nonzero(crosses, axis=1) & 1
+    return result
+
+
+def _segmentTouchesBox(edge, l, t, r, b):
+    """Liang-Barsky clip: does segment (x1, y1, x2, y2) touch the box l, t, r, b?"""
+    x1, y1, x2, y2 = edge
+    dx = x2 - x1
+    dy = y2 - y1
+    lo = 0.0
+    hi = 1.0
+    for p, q in ((-dx, x1 - l), (dx, r - x1), (-dy, y1 - t), (dy, b - y1)):
+        if p == 0:
+            # parallel to this side and outside of it
+            if q < 0:
+                return False
+        else:
+            u = q / p
+            if p < 0:
+                lo = max(lo, u)
+            else:
+                hi = min(hi, u)
+            if lo > hi:
+                return False
+    return True
+
+
 if __name__ == "__main__":
     points = [Point(4, 5)]
     for i in range(10):
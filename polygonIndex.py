@@ -0,0 +1,215 @@
+import numpy as np
+from point import Point
+from rectangle import Rectangle
+from polygon import Polygon, INSIDE, OUTSIDE
+from regionQuadTree import RegionQuadTree
+
+
+class PolygonIndex(object):
+    """
+    class PolygonIndex:
+
+        Finds which polygon (zone) points fall in, out of many polygons.
+
+    Polygons are filed in a RegionQuadTree under their mbr, so for any part of the map
+    only the polygons whose mbr reaches it are ever looked at. Polygons are prepared
+    (see Polygon.prepare) as they are added. When polygons overlap, a point belongs to
+    the one with the lowest id.
+
+    @method: add          -- add a polygon, returns its id
+    @method: candidates   -- (id, polygon) pairs whose mbr touches a rectangle
+    @method: locate       -- id of the polygon holding one point
+    @method: assignPoints -- polygon id for every point of coordinate arrays
+    @method: assignTree   -- polygon id for every point of a PointQuadTree
+    """
+
+    def __init__(self, bbox, polygons=None, maxDepth=12, prepare=True):
+        self.bbox = bbox
+        self.prepare = prepare
+        self.tree = RegionQuadTree(bbox, maxDepth)
+        self.polygons = []
+
+        for polygon in polygons or []:
+            self.add(polygon)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def add(self, polygon):
+        """Add a polygon to the index.
+        Params:
+            polygon (Polygon)
+        Returns:
+            int : id of the polygon (its position in self.polygons)
+        """
+        if not self.bbox.encompasses(polygon.mbr):
+            raise ValueError(
+                "Polygon mbr %s is outside bounding box %s" % (polygon.mbr, self.bbox)
+            )
+        if self.prepare and polygon.slabs is None:
+            polygon.prepare()
+        pid = len(self.polygons)
+        self.polygons.append(polygon)
+        self.tree.insert(polygon.mbr, pid)
+        return pid
+
+    def candidates(self, rect):
+        """Polygons whose mbr touches a rectangle, lowest id first.
+        Params:
+            rect (Rectangle)
+        Returns:
+            list : (id, polygon) tuples
+        """
+        ids = sorted(self.tree.searchOverlap(rect))
+        return [(pid, self.polygons[pid]) for pid in ids]
+
+    def locate(self, point):
+        """Id of the polygon holding a point.
+        Params:
+            point (Point)
+        Returns:
+            int : polygon id or -1 if it is in none of them
+        """
+        best = -1
+        for _, pid in self.tree.iterContaining(point.x, point.y):
+            if (best < 0 or pid < best) and self.polygons[pid].pointInsidePolygon(
+                point
+            ):
+                best = pid
+        return best
+
+    def assignPoints(self, xs, ys):
+        """Find the polygon holding every point of coordinate arrays.
+
+        The points are pushed down the region tree, splitting them up by quadrant, and
+        at each quadrant only the polygons filed there are tested, and only against the
+        points inside their mbr.
+        Params:
+            xs (array) : x coordinates
+            ys (array) : y coordinates
+        Returns:
+            ndarray(int) : polygon id per point, -1 for points in no polygon
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        result = np.full(len(xs), -1, dtype=np.int64)
+
+        b = self.bbox
+        inside = (xs >= b.left) & (xs <= b.right) & (ys >= b.top) & (ys <= b.bottom)
+        stack = [(self.tree, np.flatnonzero(inside))]
+
+        while stack:
+            node, idx = stack.pop()
+            if not idx.size:
+                continue
+
+            x = xs[idx]
+            y = ys[idx]
+            for mbr, pid in node.items:
+                near = (
+                    (x >= mbr.left)
+                    & (x <= mbr.right)
+                    & (y >= mbr.top)
+                    & (y <= mbr.bottom)
+                )
+                # keep the lowest id when polygons overlap
+                current = result[idx]
+                near &= (current < 0) | (current > pid)
+                sub = idx[near]
+                if sub.size:
+                    hits = self.polygons[pid].containsPoints(xs[sub], ys[sub])
+                    result[sub[hits]] = pid
+
+            if not node.northWest == None:
+                # points on a center line go both ways, a polygon filed on either side
+                # of it may hold them
+                mX = (node.bbox.left + node.bbox.right) / 2
+                mY = (node.bbox.top + node.bbox.bottom) / 2
+                west = x <= mX
+                east = x >= mX
+                north = y <= mY
+                south = y >= mY
+                stack.append((node.northEast, idx[north & east]))
+                stack.append((node.southEast, idx[south & east]))
+                stack.append((node.southWest, idx[south & west]))
+                stack.append((node.northWest, idx[north & west]))
+
+        return result
+
+    def assignTree(self, tree):
+        """Find the polygon holding every point of a populated PointQuadTree.
+
+        Each node of the point tree only looks at the polygons whose mbr touches it.
+        When a polygon encloses a whole node every point under it is assigned without
+        being tested.
+        Params:
+            tree (PointQuadTree)
+        Returns:
+            tuple : (points, ids) every point of the tree and an array with the
+                    polygon id of each (-1 for none)
+        """
+        points = []
+        ids = []
+        # (node, [(id, polygon, edges of the polygon crossing the node)])
+        stack = [(tree, [(pid, p, p.edges()) for pid, p in self.candidates(tree.bbox)])]
+
+        while stack:
+            node, candidates = stack.pop()
+
+            # drop polygons that miss this node and stop at the first one covering it,
+            # higher ids can't win any point after that. If nothing with a lower id
+            # crosses the node either, the covering polygon owns every point in here.
+            remaining = []
+            owner = -1
+            for pid, polygon, edges in candidates:
+                if not polygon.mbr.touches(node.bbox):
+                    continue
+                relation, edges = polygon.classifyRectangle(node.bbox, edges)
+                if relation == OUTSIDE:
+                    continue
+                if relation == INSIDE and not remaining:
+                    owner = pid
+                    break
+                remaining.append((pid, polygon, edges))
+                if relation == INSIDE:
+                    break
+
+            if owner >= 0:
+                whole = list(node.iterPoints())
+                points.extend(whole)
+                ids.extend([owner] * len(whole))
+                continue
+
+            if node.points:
+                xs = np.fromiter((p.x for p in node.points), np.float64)
+                ys = np.fromiter((p.y for p in node.points), np.float64)
+                found = np.full(len(xs), -1, dtype=np.int64)
+                for pid, polygon, _ in remaining:
+                    todo = np.flatnonzero(found < 0)
+                    if not todo.size:
+                        break
+                    hits = polygon.containsPoints(xs[todo], ys[todo])
+                    found[todo[hits]] = pid
+                points.extend(node.points)
+                ids.extend(found.tolist())
+
+            if not node.northWest == None:
+                for child in node._children():
+                    stack.append((child, remaining))
+
+        return points, np.array(ids, dtype=np.int64)
+
+
+if __name__ == "__main__":
+    bbox = Rectangle(p1=Point(0, 0), p2=Point(1000, 1000))
+    index = PolygonIndex(bbox)
+    # a grid of 10 x 10 square zones
+    for i in range(10):
+        for j in range(10):
+            x = i * 100
+            y = j * 100
+            corners = [(x, y), (x + 100, y), (x + 100, y + 100), (x, y + 100)]
+            index.add(Polygon([Point(cx, cy) for cx, cy in corners]))
+    xs = np.random.random(10000) * 1000
+    ys = np.random.random(10000) * 1000
+    print(np.bincount(index.assignPoints(xs, ys) + 1))
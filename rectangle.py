@@ -19,6 +19,7 @@ Class Rect:
 @method: set_points     -- reset rectangle coordinates
 @method: contains       -- is a point inside?
 @method: overlaps       -- does a rectangle overlap?
+@method: touches        -- does a rectangle overlap or share an edge?
 @method: top_left       -- get top-left corner
 @method: bottom_right   -- get bottom-right corner
 @method: expanded_by    -- grow (or shrink)
@@ -99,6 +100,21 @@ class Rectangle:
             and self.bottom > rect.top
         )
 
+    def touches(self, rect):
+        """Return true if a rectangle overlaps or shares an edge with this rectangle
+        (overlaps is strict).
+        Params:
+            rect (Rectangle)
+        Returns:
+            bool : True = overlaps or touches
+        """
+        return (
+            self.left <= rect.right
+            and self.right >= rect.left
+            and self.top <= rect.bottom
+            and self.bottom >= rect.top
+        )
+
     def topLeft(self):
         """
         Return the top-left corner as a Point.
@@ -0,0 +1,309 @@
+import random
+from point import Point
+from rectangle import Rectangle
+from pointQuadTree import colorList, SKIP, VISIT, ACCEPT
+
+"""
+Region (MX-CIF / loose) quadtree for things that have an extent, not just a position.
+
+Every item is stored with a Rectangle and lives in the smallest quadrant that encloses
+that rectangle completely, i.e. it goes down the tree until it would have to straddle
+one of a quadrant's center lines. Each item is stored exactly once, so overlap queries
+report each item once.
+
+With loose > 1 every quadrant's bounds are stretched by that factor around its center
+(a loose quadtree). An item then goes to the quadrant holding its center as long as it
+fits in that quadrant's stretched bounds, so small items near center lines no longer
+get stuck high up in the tree. loose=1 is a plain MX-CIF quadtree.
+"""
+
+
+class RegionQuadTree(object):
+    """
+    class RegionQuadTree:
+
+        MX-CIF (or loose) quadtree of (Rectangle, item) pairs.
+
+    @method: insert          -- store an item under its rectangle
+    @method: add             -- store a Rectangle, Polygon, Ball or Point under its extent
+    @method: remove          -- take an item out again
+    @method: update          -- move an item whose extent changed
+    @method: iterNodes       -- explicit stack traversal (same predicates as PointQuadTree)
+    @method: iterOverlapping -- lazily yield (rect, item) pairs touching a rectangle
+    @method: searchOverlap   -- items whose rectangle touches a rectangle
+    @method: iterContaining  -- lazily yield (rect, item) pairs whose rectangle holds x, y
+    @method: getBBoxes       -- node boxes for drawing
+    """
+
+    def __init__(self, bbox, maxDepth=12, parent=0, loose=1.0):
+        self.maxDepth = maxDepth
+        self.parent = parent
+        self.loose = loose
+        self.bbox = bbox
+        self.looseBBox = _loosen(bbox, loose)
+        self.color = colorList[self.parent % len(colorList)]
+
+        self.items = []
+        self.size = 0
+
+        self.northEast = None
+        self.southEast = None
+        self.southWest = None
+        self.northWest = None
+
+    def __len__(self):
+        return self.size
+
+    def __str__(self):
+        return "%s(items: %s, bbox: %s, maxDepth: %s, loose: %s)" % (
+            self.__class__.__name__,
+            self.size,
+            self.bbox,
+            self.maxDepth,
+            self.loose,
+        )
+
+    def insert(self, rect, item):
+        """
+        Store an item in the smallest quadrant whose (loose) bounds enclose its rectangle.
+        Params:
+            rect (Rectangle) : extent of the item
+            item : anything
+        Returns:
+            bool : False if the rectangle isn't inside the tree's (loose) bbox
+        """
+        if not self.looseBBox.encompasses(rect):
+            return False
+
+        self._home(rect, create=True).items.append((rect, item))
+        self.size += 1
+        return True
+
+    def add(self, obj):
+        """
+        Store a Rectangle, Polygon (by its mbr), Ball (by its radius) or Point under its
+        extent.
+        Params:
+            obj : the object to store
+        Returns:
+            bool : False if the object isn't inside the tree's (loose) bbox
+        """
+        return self.insert(extentOf(obj), obj)
+
+    def remove(self, rect, item):
+        """
+        Take an item out of the tree.
+        Params:
+            rect (Rectangle) : extent the item was stored under
+            item : the item
+        Returns:
+            bool : False if the item wasn't found
+        """
+        node = self._home(rect, create=False)
+        for i, entry in enumerate(node.items):
+            if entry[1] == item:
+                del node.items[i]
+                self.size -= 1
+                return True
+        return False
+
+    def update(self, item, oldRect, rect=None):
+        """
+        Move an item whose extent changed (like a Ball that moved).
+        Params:
+            item : the item
+            oldRect (Rectangle) : extent it was stored under
+            rect (Rectangle) : new extent, defaults to extentOf(item)
+        Returns:
+            bool : False if the item is no longer inside the tree's (loose) bbox
+        """
+        if rect is None:
+            rect = extentOf(item)
+        self.remove(oldRect, item)
+        return self.insert(rect, item)
+
+    def _home(self, rect, create):
+        """
+        Walk down to the node a rectangle belongs in: follow the quadrant holding the
+        rectangle's center while the rectangle fits in that quadrant's loose bounds.
+        Quadrants are only created on the way down when `create` is set.
+        """
+        cx = (rect.left + rect.right) / 2
+        cy = (rect.top + rect.bottom) / 2
+        node = self
+        depth = 0
+        while depth < self.maxDepth:
+            l = node.bbox.left
+            r = node.bbox.right
+            t = node.bbox.top
+            b = node.bbox.bottom
+            mX = (l + r) / 2
+            mY = (t + b) / 2
+            east = cx >= mX
+            south = cy >= mY
+
+            # loose bounds of the quadrant holding the center
+            cl, cr = (mX, r) if east else (l, mX)
+            ct, cb = (mY, b) if south else (t, mY)
+            padX = (cr - cl) * (self.loose - 1) / 2
+            padY = (cb - ct) * (self.loose - 1) / 2
+            if (
+                rect.left < cl - padX
+                or rect.right > cr + padX
+                or rect.top < ct - padY
+                or rect.bottom > cb + padY
+            ):
+                break
+
+            if node.northEast == None:
+                if not create:
+                    break
+                node.subdivide()
+            if east:
+                node = node.southEast if south else node.northEast
+            else:
+                node = node.southWest if south else node.northWest
+            depth += 1
+        return node
+
+    def subdivide(self):
+        """
+        Split this node into four quadrants for NW/NE/SE/SW
+        """
+        l = self.bbox.left
+        r = self.bbox.right
+        t = self.bbox.top
+        b = self.bbox.bottom
+        mX = (l + r) / 2
+        mY = (t + b) / 2
+        self.northEast = self._child(Rectangle(p1=Point(mX, t), p2=Point(r, mY)))
+        self.southEast = self._child(Rectangle(p1=Point(mX, mY), p2=Point(r, b)))
+        self.southWest = self._child(Rectangle(p1=Point(l, mY), p2=Point(mX, b)))
+        self.northWest = self._child(Rectangle(p1=Point(l, t), p2=Point(mX, mY)))
+
+    def _child(self, bbox):
+        return self.__class__(bbox, self.maxDepth, self.parent + 1, self.loose)
+
+    def _children(self):
+        return (self.northEast, self.southEast, self.southWest, self.northWest)
+
+    def iterNodes(self, predicate=None):
+        """
+        Walk the tree depth first with an explicit stack. Same contract as
+        PointQuadTree.iterNodes: predicate(node) returns SKIP, VISIT or ACCEPT.
+        Params:
+            predicate (callable) : node -> SKIP / VISIT / ACCEPT
+        Returns:
+            generator : (node, accepted) tuples
+        """
+        stack = [(self, False)]
+        while stack:
+            node, accepted = stack.pop()
+            if not accepted and predicate is not None:
+                verdict = predicate(node)
+                if verdict == SKIP:
+                    continue
+                accepted = verdict == ACCEPT
+
+            yield node, accepted
+
+            if not node.northWest == None:
+                stack.append((node.southEast, accepted))
+                stack.append((node.southWest, accepted))
+                stack.append((node.northEast, accepted))
+                stack.append((node.northWest, accepted))
+
+    def iterOverlapping(self, query):
+        """Lazily yield the (rect, item) pairs whose rectangle touches a query.
+
+        Quadrants whose loose bounds don't touch the query can't hold anything that
+        does. Items in quadrants the query encompasses touch it without being tested.
+        Params:
+            query : a Rectangle, or any object extentOf understands
+        """
+        rect = extentOf(query)
+
+        def predicate(node):
+            if not node.looseBBox.touches(rect):
+                return SKIP
+            if rect.encompasses(node.looseBBox):
+                return ACCEPT
+            return VISIT
+
+        for node, accepted in self.iterNodes(predicate):
+            if accepted:
+                yield from node.items
+            else:
+                for entry in node.items:
+                    if entry[0].touches(rect):
+                        yield entry
+
+    def searchOverlap(self, query):
+        """Return the items whose rectangle touches a query, each of them once.
+        Params:
+            query : a Rectangle, or any object extentOf understands
+        Returns:
+            list : items
+        """
+        return [item for _, item in self.iterOverlapping(query)]
+
+    def iterContaining(self, x, y):
+        """Lazily yield the (rect, item) pairs whose rectangle holds the point x, y."""
+
+        def predicate(node):
+            b = node.looseBBox
+            if b.left <= x <= b.right and b.top <= y <= b.bottom:
+                return VISIT
+            return SKIP
+
+        for node, _ in self.iterNodes(predicate):
+            for entry in node.items:
+                r = entry[0]
+                if r.left <= x <= r.right and r.top <= y <= r.bottom:
+                    yield entry
+
+    def iterBBoxes(self):
+        """Lazily yield the draw info of every node."""
+        for node, _ in self.iterNodes():
+            yield {"bbox": node.bbox, "color": node.color, "parent": node.parent}
+
+    def getBBoxes(self):
+        """Print helper to draw tree"""
+        return list(self.iterBBoxes())
+
+
+def extentOf(obj):
+    """Bounding Rectangle of a Rectangle, Polygon (its mbr), Ball (center +- radius)
+    or Point (zero size).
+    """
+    if isinstance(obj, Rectangle):
+        return obj
+    mbr = getattr(obj, "mbr", None)
+    if mbr is not None:
+        return mbr
+    r = getattr(obj, "radius", 0)
+    return Rectangle(p1=Point(obj.x - r, obj.y - r), p2=Point(obj.x + r, obj.y + r))
+
+
+def _loosen(bbox, loose):
+    """bbox stretched by a factor of `loose` around its center."""
+    if loose == 1:
+        return bbox
+    padX = bbox.w * (loose - 1) / 2
+    padY = bbox.h * (loose - 1) / 2
+    return Rectangle(
+        p1=Point(bbox.left - padX, bbox.top - padY),
+        p2=Point(bbox.right + padX, bbox.bottom + padY),
+    )
+
+
+if __name__ == "__main__":
+    tree = RegionQuadTree(Rectangle(p1=Point(0, 0), p2=Point(1000, 1000)), loose=2)
+    for i in range(100):
+        x = random.randint(0, 950)
+        y = random.randint(0, 950)
+        w = random.randint(1, 50)
+        h = random.randint(1, 50)
+        tree.insert(Rectangle(p1=Point(x, y), p2=Point(x + w, y + h)), i)
+    print(tree)
+    print(tree.searchOverlap(Rectangle(p1=Point(100, 100), p2=Point(300, 300))))
@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from point import Point
+from rectangle import Rectangle
+from arrayQuadTree import ArrayQuadTree
+
+"""
+Read only queries against one ArrayQuadTree, spread over a pool of processes.
+
+The tree is published once as a snapshot (ArrayQuadTree.saveBuffer) in a block of
+shared memory. Every worker attaches to the block when it starts and opens the tree
+straight from it (ArrayQuadTree.fromBuffer), so the workers all read the same pages
+instead of each holding a copy. Only the queries and their results cross between
+processes: a batch of queries is cut into slices, one per task, and the answers are
+put back together in the order the queries came in.
+
+The published tree is a snapshot, later changes to the original tree aren't seen.
+
+@class: SharedQueryExecutor -- box and nearest queries on a shared tree
+"""
+
+# queries per task unless told otherwise
+BATCH_SIZE = 4096
+
+# the worker's view of the published tree, set up by _attach
+_shared = {}
+
+
+class SharedQueryExecutor(object):
+    """
+    class SharedQueryExecutor:
+
+        Runs batches of queries against a tree published in shared memory.
+
+    Use it as a context manager, or call close() when done, so the workers are stopped
+    and the shared block is freed.
+
+    @method: searchBoxMany -- ids inside each of many rectangles
+    @method: nearestMany   -- k closest points to each of many points
+    @method: close         -- stop the workers and free the shared memory
+    """
+
+    def __init__(self, tree, workers=None, batchSize=BATCH_SIZE):
+        """
+        Params:
+            tree (ArrayQuadTree) : tree to publish
+            workers (int) : processes to use, defaults to the number of CPUs
+            batchSize (int) : queries per task
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.batchSize = batchSize
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=max(tree.snapshotSize(), 1)
+        )
+        tree.saveBuffer(self.memory.buf)
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_attach,
+            initargs=(self.memory.name,),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __str__(self):
+        return "%s(workers: %s, shared: %s bytes)" % (
+            self.__class__.__name__,
+            self.workers,
+            self.memory.size,
+        )
+
+    def close(self):
+        """Stop the workers and free the shared memory block."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.memory.close()
+            self.memory.unlink()
+
+    def searchBoxMany(self, rects):
+        """Ids of the points inside each of many rectangles (see
+        ArrayQuadTree.searchBoxMany).
+        Params:
+            rects (array) : (m, 4) left, top, right, bottom per query, or Rectangles
+        Returns:
+            tuple : (offsets, indices) in CSR layout, the ids matching query i are
+                    indices[offsets[i]:offsets[i + 1]]
+        """
+        if len(rects) and hasattr(rects[0], "left"):
+            rects = [(r.left, r.top, r.right, r.bottom) for r in rects]
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+
+        # stitch the per batch CSR results together, shifting each batch's offsets
+        offsets = [np.zeros(1, dtype=np.int64)]
+        indices = [np.empty(0, dtype=np.int64)]
+        total = 0
+        for batchOffsets, batchIds in self._map(_searchBoxMany, rects):
+            offsets.append(batchOffsets[1:] + total)
+            indices.append(batchIds)
+            total += len(batchIds)
+        return np.concatenate(offsets), np.concatenate(indices)
+
+    def nearestMany(self, points, k=1, maxDistance=None):
+        """The k closest points to each of many points (see ArrayQuadTree.nearest).
+        Params:
+            points (array) : (m, 2) x, y per query, or anything with x and y
+            k (int) : number of points wanted per query
+            maxDistance (float) : ignore points further away than this
+        Returns:
+            list : (ids, distances) per query, closest first
+        """
+        if len(points) and hasattr(points[0], "x"):
+            points = [(p.x, p.y) for p in points]
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+        found = []
+        for batch in self._map(_nearestMany, points, k, maxDistance):
+            found.extend(batch)
+        return found
+
+    def _map(self, task, queries, *args):
+        """Run `task` over slices of the queries, yielding the results in order."""
+        if self.pool is None:
+            raise ValueError("This executor is closed")
+        slices = [
+            queries[i : i + self.batchSize]
+            for i in range(0, len(queries), self.batchSize)
+        ]
+        return self.pool.map(task, slices, *[[arg] * len(slices) for arg in args])
+
+
+def _attach(name):
+    """Worker start up: open the published tree from the shared block."""
+    memory = shared_memory.SharedMemory(name=name)
+    _shared["memory"] = memory
+    _shared["tree"] = ArrayQuadTree.fromBuffer(memory.buf, name)
+
+
+def _searchBoxMany(rects):
+    return _shared["tree"].searchBoxMany(rects)
+
+
+def _nearestMany(points, k, maxDistance):
+    tree = _shared["tree"]
+    return [tree.nearest(Point(x, y), k, maxDistance) for x, y in points.tolist()]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    bbox = Rectangle(p1=Point(0, 0), p2=Point(1000, 1000))
+    tree = ArrayQuadTree.fromArrays(
+        bbox, np.random.random(n) * 1000, np.random.random(n) * 1000
+    )
+    corners = np.random.random((100000, 2)) * 990
+    rects = np.hstack((corners, corners + 10))
+
+    began = time.perf_counter()
+    tree.searchBoxMany(rects)
+    print("in process %.2fs" % (time.perf_counter() - began))
+
+    with SharedQueryExecutor(tree) as executor:
+        began = time.perf_counter()
+        offsets, ids = executor.searchBoxMany(rects)
+        print("%s %.2fs" % (executor, time.perf_counter() - began))
+        print(len(ids), "hits,", executor.nearestMany(corners[:3], 2))
@@ -0,0 +1,414 @@
+import heapq
+import itertools
+import math
+import random
+import numpy as np
+from point import Point
+from rectangle import Rectangle
+from pointQuadTree import colorList
+
+"""
+Uniform grid index for points, an alternative to PointQuadTree when the points are
+spread fairly evenly (like the balls of initSomeBalls). The bbox is cut into square
+cells and each cell keeps a bucket (an array backed run of point indexes) of the points
+in it. Finding a point's cell is one division per axis, so inserting, moving and looking
+around a point never walk a tree.
+
+It answers the same calls as PointQuadTree (insert / remove / update / searchBox /
+searchRadius / nearest / getBBoxes), so TreeDriver and the collision code can use either.
+"""
+
+
+class SpatialHashGrid(object):
+    """
+    class SpatialHashGrid:
+
+        Fixed grid of point buckets over a bounding box.
+
+    The cell size is either given, or derived from the typical ball radius (4 radii, so
+    a collision search around a ball only spans a few cells). Cells are numbered
+    row * cols + col.
+
+    Buckets are kept in arrays, the same way ArrayQuadTree keeps its leaves: `points`
+    holds the point objects, and cell i's bucket is the run
+    slots[cellStart[i]:cellStart[i] + cellCount[i]] of point indexes, with room for
+    cellCapacity[i]. reset() lays every bucket out in one go by sorting the points on
+    their cell id, so the buckets follow each other in cell order. A bucket that
+    outgrows its room later moves to the end of the slot pool.
+
+    @method: insert        -- put a point in its cell
+    @method: remove        -- take a point out again
+    @method: update        -- move a point to the cell of its new position
+    @method: reset         -- clear the grid and bucket a list of points at once
+    @method: searchBox     -- points inside a rectangle
+    @method: searchRadius  -- points within a distance of a center
+    @method: nearest       -- k closest points
+    @method: getBBoxes     -- occupied cells for drawing
+    """
+
+    def __init__(self, bbox, cellSize=None, radius=None):
+        self.bbox = bbox
+        if cellSize is None:
+            if radius is not None:
+                cellSize = 4 * radius
+            else:
+                cellSize = max(bbox.w, bbox.h) / 64
+        self.cellSize = cellSize
+        self.cols = max(1, int(math.ceil(bbox.w / cellSize)))
+        self.rows = max(1, int(math.ceil(bbox.h / cellSize)))
+        self.reset([])
+
+    def __len__(self):
+        return self.size
+
+    def __str__(self):
+        return "%s(points: %s, bbox: %s, cellSize: %s, cells: %sx%s)" % (
+            self.__class__.__name__,
+            self.size,
+            self.bbox,
+            self.cellSize,
+            self.cols,
+            self.rows,
+        )
+
+    def _col(self, x):
+        c = int((x - self.bbox.left) // self.cellSize)
+        return min(max(c, 0), self.cols - 1)
+
+    def _row(self, y):
+        r = int((y - self.bbox.top) // self.cellSize)
+        return min(max(r, 0), self.rows - 1)
+
+    def _cell(self, x, y):
+        return self._row(y) * self.cols + self._col(x)
+
+    def _cells(self, xs, ys):
+        """Cell ids of coordinate arrays, the vectorized _cell."""
+        cols = np.floor_divide(xs - self.bbox.left, self.cellSize).astype(np.int64)
+        rows = np.floor_divide(ys - self.bbox.top, self.cellSize).astype(np.int64)
+        np.clip(cols, 0, self.cols - 1, out=cols)
+        np.clip(rows, 0, self.rows - 1, out=rows)
+        return rows * self.cols + cols
+
+    def _cellBox(self, i):
+        """Bounds of cell i as (left, top, right, bottom), clipped to the bbox."""
+        r, c = divmod(i, self.cols)
+        l = self.bbox.left + c * self.cellSize
+        t = self.bbox.top + r * self.cellSize
+        return (
+            l,
+            t,
+            min(l + self.cellSize, self.bbox.right),
+            min(t + self.cellSize, self.bbox.bottom),
+        )
+
+    def _bucket(self, i):
+        """The points in cell i."""
+        start = self.cellStart[i]
+        indexes = self.slots[start : start + self.cellCount[i]].tolist()
+        points = self.points
+        return [points[j] for j in indexes]
+
+    def insert(self, point):
+        """
+        Put a point in the bucket of its cell.
+        Params:
+            point (Point)
+        Returns:
+            bool : False if the point is outside the bbox
+        """
+        if not self.bbox.contains(point):
+            return False
+        if self.free:
+            index = self.free.pop()
+            self.points[index] = point
+        else:
+            index = len(self.points)
+            self.points.append(point)
+        self._append(self._cell(point.x, point.y), index)
+        self.size += 1
+        return True
+
+    def _append(self, cell, index):
+        count = self.cellCount[cell]
+        if count == self.cellCapacity[cell]:
+            if self.numSlots > 2 * len(self.points) + len(self.cellCount):
+                self._compact()
+            self._reserve(cell, max(4, 2 * count))
+        self.slots[self.cellStart[cell] + count] = index
+        self.cellCount[cell] = count + 1
+
+    def _reserve(self, cell, capacity):
+        """Give `cell` a fresh slot range at the end of the pool, keeping its points."""
+        start = self.numSlots
+        if start + capacity > len(self.slots):
+            grown = np.empty(max(start + capacity, 2 * len(self.slots)), np.int64)
+            grown[:start] = self.slots[:start]
+            self.slots = grown
+        count = self.cellCount[cell]
+        old = self.cellStart[cell]
+        self.slots[start : start + count] = self.slots[old : old + count]
+        self.cellStart[cell] = start
+        self.cellCapacity[cell] = capacity
+        self.numSlots += capacity
+
+    def _compact(self):
+        """Pack the buckets back together in cell order, dropping the spare room."""
+        counts = self.cellCount
+        starts = np.cumsum(counts) - counts
+        total = int(counts.sum())
+        offsets = np.repeat(self.cellStart - starts, counts) + np.arange(total)
+        self.slots = self.slots[offsets]
+        self.cellStart = starts
+        self.cellCapacity = counts.copy()
+        self.numSlots = total
+
+    def remove(self, point):
+        """
+        Remove a point (the same object that was inserted).
+        Params:
+            point (Point)
+        Returns:
+            bool : False if the point wasn't in the grid
+        """
+        if not self._containsXY(point.x, point.y):
+            return False
+        index = self._take(point, self._cell(point.x, point.y))
+        if index < 0:
+            return False
+        self._release(index)
+        return True
+
+    def _take(self, point, cell):
+        """Take `point` out of the bucket of `cell`. Returns its index, -1 if it isn't
+        there."""
+        start = self.cellStart[cell]
+        count = self.cellCount[cell]
+        points = self.points
+        for k, index in enumerate(self.slots[start : start + count].tolist()):
+            if points[index] is point:
+                # the last point of the bucket fills the gap
+                self.slots[start + k] = self.slots[start + count - 1]
+                self.cellCount[cell] = count - 1
+                return index
+        return -1
+
+    def _release(self, index):
+        self.points[index] = None
+        self.free.append(index)
+        self.size -= 1
+
+    def update(self, point, oldX, oldY):
+        """
+        A point in the grid moved from (oldX, oldY) to (point.x, point.y). Nothing
+        happens unless it crossed into another cell. A point that wasn't in the grid yet
+        is inserted.
+        Params:
+            point (Point)
+            oldX (float) : x before the move
+            oldY (float) : y before the move
+        Returns:
+            bool : False if the point has left the grid's bbox (it is removed)
+        """
+        inside = self.bbox.contains(point)
+        if not self._containsXY(oldX, oldY):
+            return self.insert(point)
+
+        old = self._cell(oldX, oldY)
+        if inside and old == self._cell(point.x, point.y):
+            start = self.cellStart[old]
+            for index in self.slots[start : start + self.cellCount[old]].tolist():
+                if self.points[index] is point:
+                    return True
+            return self.insert(point)
+
+        index = self._take(point, old)
+        if index < 0:
+            return self.insert(point)
+        if not inside:
+            self._release(index)
+            return False
+        self._append(self._cell(point.x, point.y), index)
+        return True
+
+    def reset(self, points):
+        """Clear the grid and load a list of points, bucketing them all at once: the
+        points are sorted on their cell id, so each cell's bucket is one run of the
+        sorted order. Points outside the bbox are skipped."""
+        points = [p for p in points if self.bbox.contains(p)]
+        n = len(points)
+        xs = np.fromiter((p.x for p in points), np.float64, n)
+        ys = np.fromiter((p.y for p in points), np.float64, n)
+        cells = self._cells(xs, ys)
+
+        self.points = points
+        self.free = []
+        self.size = n
+        self.slots = np.argsort(cells, kind="stable").astype(np.int64)
+        self.numSlots = n
+        self.cellCount = np.bincount(cells, minlength=self.cols * self.rows)
+        self.cellStart = np.cumsum(self.cellCount) - self.cellCount
+        self.cellCapacity = self.cellCount.copy()
+
+    def _containsXY(self, x, y):
+        b = self.bbox
+        return b.left <= x <= b.right and b.top <= y <= b.bottom
+
+    def iterPoints(self):
+        """Lazily yield every point in the grid."""
+        for i in np.flatnonzero(self.cellCount).tolist():
+            yield from self._bucket(i)
+
+    def iterSearchBox(self, bbox):
+        """Lazily yield the points inside a bounding box.
+
+        Only the cells the box overlaps are looked at, and the points of cells lying
+        completely inside the box are yielded without being tested.
+        """
+        c0 = self._col(bbox.left)
+        c1 = self._col(bbox.right)
+        r0 = self._row(bbox.top)
+        r1 = self._row(bbox.bottom)
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                i = r * self.cols + c
+                if not self.cellCount[i]:
+                    continue
+                bucket = self._bucket(i)
+                l, t, rt, b = self._cellBox(i)
+                if (
+                    bbox.left <= l
+                    and rt <= bbox.right
+                    and bbox.top <= t
+                    and b <= bbox.bottom
+                ):
+                    yield from bucket
+                else:
+                    for p in bucket:
+                        if bbox.contains(p):
+                            yield p
+
+    def searchBox(self, bbox):
+        """Return all points within the specified bounding box.
+        Params:
+            bbox (Rectangle)
+        Returns:
+            list : matching points
+        """
+        return list(self.iterSearchBox(bbox))
+
+    def iterSearchRadius(self, center, r):
+        """Lazily yield the points within distance r of a center point."""
+        x = center.x
+        y = center.y
+        rSq = r * r
+        c0 = self._col(x - r)
+        c1 = self._col(x + r)
+        r0 = self._row(y - r)
+        r1 = self._row(y + r)
+        for row in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                for p in self._bucket(row * self.cols + c):
+                    dx = p.x - x
+                    dy = p.y - y
+                    if dx * dx + dy * dy <= rSq:
+                        yield p
+
+    def searchRadius(self, center, r):
+        """Return all points within distance r of a center point.
+        Params:
+            center (Point) : anything with x and y (a Ball works)
+            r (float) : radius
+        Returns:
+            list : matching points
+        """
+        return list(self.iterSearchRadius(center, r))
+
+    def iterNearest(self, point, maxDistance=None):
+        """Lazily yield points closest first, as (point, distance) tuples.
+
+        Cells are flooded outwards from the point's own cell in order of their distance
+        to the point, sharing one priority queue with the points found in them, so a
+        point is only yielded once no unopened cell could hold anything closer.
+        Params:
+            point (Point) : anything with x and y
+            maxDistance (float) : stop once points are further away than this
+        Returns:
+            generator : (point, distance) tuples, closest first
+        """
+        x = point.x
+        y = point.y
+        limit = None if maxDistance is None else maxDistance * maxDistance
+
+        start = self._cell(x, y)
+        seen = {start}
+        # entries are (distance squared, tie breaker, cell, point), cell is -1 for points
+        tie = 0
+        queue = [(self._cellDistanceSq(start, x, y), tie, start, None)]
+
+        while queue:
+            d, _, i, p = heapq.heappop(queue)
+            if limit is not None and d > limit:
+                return
+
+            if i < 0:
+                yield p, math.sqrt(d)
+                continue
+
+            for p in self._bucket(i):
+                dx = p.x - x
+                dy = p.y - y
+                tie += 1
+                heapq.heappush(queue, (dx * dx + dy * dy, tie, -1, p))
+
+            r, c = divmod(i, self.cols)
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < self.rows and 0 <= nc < self.cols:
+                    j = nr * self.cols + nc
+                    if j not in seen:
+                        seen.add(j)
+                        tie += 1
+                        heapq.heappush(
+                            queue, (self._cellDistanceSq(j, x, y), tie, j, None)
+                        )
+
+    def nearest(self, point, k=1, maxDistance=None):
+        """Find the k points closest to a point.
+        Params:
+            point (Point) : anything with x and y
+            k (int) : number of points wanted
+            maxDistance (float) : ignore points further away than this
+        Returns:
+            list : up to k (point, distance) tuples, closest first
+        """
+        if k <= 0:
+            return []
+        return list(itertools.islice(self.iterNearest(point, maxDistance), k))
+
+    def _cellDistanceSq(self, i, x, y):
+        l, t, r, b = self._cellBox(i)
+        dx = max(l - x, 0, x - r)
+        dy = max(t - y, 0, y - b)
+        return dx * dx + dy * dy
+
+    def iterBBoxes(self):
+        """Lazily yield the draw info of every occupied cell."""
+        for i in np.flatnonzero(self.cellCount).tolist():
+            l, t, r, b = self._cellBox(i)
+            yield {
+                "bbox": Rectangle(p1=Point(l, t), p2=Point(r, b)),
+                "color": colorList[int(self.cellCount[i]) % len(colorList)],
+                "parent": 0,
+            }
+
+    def getBBoxes(self):
+        """Print helper to draw the grid"""
+        return list(self.iterBBoxes())
+
+
+if __name__ == "__main__":
+    grid = SpatialHashGrid(Rectangle(p1=Point(0, 0), p2=Point(700, 500)), radius=3)
+    for i in range(1000):
+        grid.insert(Point(random.randint(0, 700), random.randint(0, 500)))
+    print(grid)
+    print(grid.nearest(Point(350, 250), 3))
@@ -0,0 +1,148 @@
+import random
+from point import Point
+from rectangle import Rectangle
+from pointQuadTree import PointQuadTree
+
+"""
+Dual-tree distance join: every pair of points (a, b), a from one PointQuadTree and b from
+another (or the same) tree, that are no further than d apart.
+
+Both trees are walked at once as pairs of node sets. A pair whose tight extents (the
+count / min / max aggregates of the nodes) are more than d apart is dropped with
+everything under it. A pair whose extents are within d of each other even at their
+farthest corners is reported whole, without testing a single distance. Only the pairs in
+between are split further, so the work follows the number of pairs found instead of
+one tree search per point.
+
+A node set is either a whole subtree, or just the points a node holds itself (inner
+nodes of an inserted tree keep their own points, they form a pseudo leaf).
+
+@function: distanceJoin -- all pairs within d between two trees, or within one tree
+@function: nodeParts    -- a whole subtree as its node's own points and its quadrants
+"""
+
+
+def distanceJoin(a, b, d):
+    """Find every pair of points within distance d of each other.
+    Params:
+        a (PointQuadTree) : left tree
+        b (PointQuadTree) : right tree, None or `a` itself for a self join, which
+                            reports every unordered pair once and no point with itself
+        d (float) : largest distance between the points of a pair
+    Returns:
+        tuple : (left, right) parallel lists, left[i] from a and right[i] from b
+    """
+    left = []
+    right = []
+    dSq = d * d
+    same = b is None or b is a
+
+    # entries are (node, whole, node, whole) with whole=False for a node's own points
+    stack = [(a, True, a if same else b, True)]
+    while stack:
+        nodeA, wholeA, nodeB, wholeB = stack.pop()
+        if not nodeA.count or not nodeB.count:
+            continue
+        if _extentGapSq(nodeA, nodeB) > dSq:
+            continue
+        mirror = same and nodeA is nodeB and wholeA == wholeB
+
+        if _extentSpanSq(nodeA, nodeB) <= dSq:
+            # even the farthest points of the two are close enough
+            pointsA = _points(nodeA, wholeA)
+            if mirror:
+                for i, p in enumerate(pointsA):
+                    for q in pointsA[i + 1 :]:
+                        left.append(p)
+                        right.append(q)
+            else:
+                pointsB = _points(nodeB, wholeB)
+                for p in pointsA:
+                    left.extend([p] * len(pointsB))
+                    right.extend(pointsB)
+            continue
+
+        splitA = wholeA and not nodeA.northWest == None
+        splitB = wholeB and not nodeB.northWest == None
+
+        if not splitA and not splitB:
+            _testPairs(nodeA.points, nodeB.points, mirror, dSq, left, right)
+            continue
+
+        if mirror:
+            parts = nodeParts(nodeA)
+            for i, (node, whole) in enumerate(parts):
+                stack.append((node, whole, node, whole))
+                for other, otherWhole in parts[i + 1 :]:
+                    stack.append((node, whole, other, otherWhole))
+            continue
+
+        # split the bigger of the two (the one that can still be split)
+        if splitA and (not splitB or _size(nodeA) >= _size(nodeB)):
+            for node, whole in nodeParts(nodeA):
+                stack.append((node, whole, nodeB, wholeB))
+        else:
+            for node, whole in nodeParts(nodeB):
+                stack.append((nodeA, wholeA, node, whole))
+
+    return left, right
+
+
+def nodeParts(node):
+    """Split a whole subtree into the node's own points and its non empty quadrants,
+    as (node, whole) tuples: whole is False for the node's own points."""
+    parts = [(child, True) for child in node._children() if child.count]
+    if node.points:
+        parts.append((node, False))
+    return parts
+
+
+def _points(node, whole):
+    if whole:
+        return list(node.iterPoints())
+    return node.points
+
+
+def _testPairs(pointsA, pointsB, mirror, dSq, left, right):
+    """Distance test between two point lists (one list against itself if mirror)."""
+    for i, p in enumerate(pointsA):
+        x = p.x
+        y = p.y
+        for q in pointsA[i + 1 :] if mirror else pointsB:
+            dx = q.x - x
+            dy = q.y - y
+            if dx * dx + dy * dy <= dSq:
+                left.append(p)
+                right.append(q)
+
+
+def _extentGapSq(a, b):
+    """Squared distance between the tight extents of two nodes (0 if they overlap)."""
+    dx = max(a.minX - b.maxX, 0, b.minX - a.maxX)
+    dy = max(a.minY - b.maxY, 0, b.minY - a.maxY)
+    return dx * dx + dy * dy
+
+
+def _extentSpanSq(a, b):
+    """Squared distance between the farthest corners of two nodes' tight extents."""
+    dx = max(a.maxX - b.minX, b.maxX - a.minX)
+    dy = max(a.maxY - b.minY, b.maxY - a.minY)
+    return dx * dx + dy * dy
+
+
+def _size(node):
+    return max(node.maxX - node.minX, node.maxY - node.minY)
+
+
+if __name__ == "__main__":
+    bbox = Rectangle(p1=Point(0, 0), p2=Point(1000, 1000))
+    trees = []
+    for _ in range(2):
+        tree = PointQuadTree(bbox, 4)
+        for i in range(2000):
+            tree.insert(Point(random.random() * 1000, random.random() * 1000))
+        trees.append(tree)
+    left, right = distanceJoin(trees[0], trees[1], 10)
+    print(len(left), "pairs between the trees")
+    left, right = distanceJoin(trees[0], None, 10)
+    print(len(left), "pairs within the first tree")